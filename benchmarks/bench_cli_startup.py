@@ -0,0 +1,86 @@
+"""
+Benchmark of musicie cold start. Times `musicie --help` in fresh interpreters, and checks
+that importing the cli doesn't import any of the heavy exercise dependencies. Exits with
+an error if either check regresses, so it can be run in ci.
+
+Usage:
+    python benchmarks/bench_cli_startup.py --runs 10 --max_seconds 0.5
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+# modules that should only be imported once an exercise has been selected
+HEAVY_MODULES = [
+    "boto3",
+    "musicbrainzngs",
+    "numpy",
+    "pandas",
+    "pdfplumber",
+    "pdfkit",
+    "pyarrow",
+    "PyPDF2",
+    "sqlalchemy",
+    "tabula",
+]
+
+
+def get_imported_heavy_modules() -> list:
+    """
+    Function to return the heavy modules imported by importing the cli in a fresh interpreter
+    """
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, musicie.cli; print(' '.join(sorted(sys.modules)))",
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.split()
+    return [module for module in HEAVY_MODULES if module in output]
+
+
+def time_cli_help(n_runs: int) -> list:
+    """
+    Function to time `musicie --help` in n_runs fresh interpreters
+    """
+    timings = []
+    for _ in range(n_runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "musicie.cli", "--help"],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run_benchmark(n_runs: int, max_seconds: float) -> None:
+    """
+    Function to run the startup checks, exiting with an error if either fails
+    """
+    imported_heavy_modules = get_imported_heavy_modules()
+    timings = time_cli_help(n_runs)
+    median_seconds = statistics.median(timings)
+    print(
+        f"musicie --help: median {median_seconds:.3f}s, "
+        f"min {min(timings):.3f}s, max {max(timings):.3f}s over {n_runs} runs"
+    )
+    print(f"heavy modules imported by musicie.cli: {imported_heavy_modules or 'none'}")
+    if imported_heavy_modules:
+        sys.exit(f"musicie.cli imports {imported_heavy_modules} at startup")
+    if median_seconds > max_seconds:
+        sys.exit(f"musicie --help took {median_seconds:.3f}s, more than {max_seconds}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max_seconds", type=float, default=0.5)
+    args = parser.parse_args()
+    run_benchmark(args.runs, args.max_seconds)
@@ -0,0 +1,135 @@
+"""
+Micro-benchmark comparing the per-row extract_track_titles implementation with the
+vectorized one on a synthetic music royalties table.
+
+Usage:
+    python benchmarks/bench_extract_track_titles.py --rows 1000000
+"""
+import argparse
+import copy
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from musicie.exercise_1_ingest_structure_pdf_royalty_statements.wc_music_corp import (
+    extract_track_titles,
+)
+
+TRACK_NAMES = ["LOVE SONG", "BLUE SKY", "SUN DAY", "Other, Track", "lower case"]
+
+
+def legacy_extract_track_titles(input_page_data: list) -> list:
+    """
+    Function to add track titles to input dataframes, one row at a time
+    """
+    for page in input_page_data:
+        output_page_tables = []
+        for page_table in page["page_tables"]:
+            if not page_table.empty:
+                page_table["track_information"] = page_table["Income Type"][
+                    page_table["Statement Id"].isna()
+                ]
+                page_table["track_title"] = (
+                    page_table["track_information"]
+                    .fillna(method="ffill")
+                    .str.split("-")
+                    .str[0]
+                    .replace(r"\s+", " ", regex=True)
+                )
+                page_table["track_title"] = page_table["track_title"].apply(
+                    lambda x: x
+                    if re.match(r"\b[A-Z][A-Z]+\b", x) and not "," in x
+                    else None
+                )
+                track_totals = (
+                    page_table["track_information"]
+                    .str.replace(",", "")
+                    .str.extractall(r"(\d+\.\d{3})")
+                    .unstack()
+                )
+                track_totals.columns = track_totals.columns.droplevel()
+                output_df = pd.concat(
+                    [
+                        page_table.drop(columns=["track_information"]),
+                        track_totals.rename(
+                            columns={0: "track_amount_received", 1: "track_amount_paid"}
+                        ),
+                    ],
+                    axis=1,
+                )
+                output_df[["track_amount_received", "track_amount_paid"]] = output_df[
+                    ["track_amount_received", "track_amount_paid"]
+                ].fillna(method="ffill")
+                output_page_tables.append(output_df)
+        page["page_tables"] = output_page_tables
+    return input_page_data
+
+
+def make_royalties_pages(n_rows: int, rows_per_page: int, seed=0) -> list:
+    """
+    Function to create synthetic music royalties page data, with a track header row
+    every few rows
+    """
+    rng = np.random.default_rng(seed)
+    is_track_row = np.arange(n_rows) % rows_per_page % 5 == 0
+    tracks = rng.choice(TRACK_NAMES, n_rows)
+    received = rng.integers(0, 100000, n_rows)
+    paid = rng.integers(0, 100000, n_rows)
+    royalties = pd.DataFrame(
+        {
+            "Income Type": np.where(
+                is_track_row,
+                [
+                    f"{track} - Writer {r:,}.{r % 1000:03d} {p:,}.{p % 1000:03d}"
+                    for track, r, p in zip(tracks, received, paid)
+                ],
+                "Performance",
+            ),
+            "Statement Id": np.where(is_track_row, np.nan, 1.0),
+            "Units": rng.integers(1, 2000, n_rows).astype(str),
+            "Amount Paid": rng.random(n_rows).round(2).astype(str),
+        }
+    )
+    return [
+        {
+            "page_number": i + 1,
+            "page_tables": [
+                royalties.iloc[start : start + rows_per_page].reset_index(drop=True)
+            ],
+        }
+        for i, start in enumerate(range(0, n_rows, rows_per_page))
+    ]
+
+
+def run_benchmark(n_rows: int, rows_per_page: int) -> None:
+    """
+    Function to time both implementations and check their outputs are identical
+    """
+    page_data = make_royalties_pages(n_rows, rows_per_page)
+    timings = {}
+    outputs = {}
+    for name, func in [
+        ("legacy", legacy_extract_track_titles),
+        ("vectorized", extract_track_titles),
+    ]:
+        input_page_data = copy.deepcopy(page_data)
+        start = time.perf_counter()
+        outputs[name] = pd.concat(
+            [table for page in func(input_page_data) for table in page["page_tables"]],
+            ignore_index=True,
+        )
+        timings[name] = time.perf_counter() - start
+        print(f"{name}: {timings[name]:.2f}s ({n_rows / timings[name]:,.0f} rows/s)")
+    pd.testing.assert_frame_equal(outputs["legacy"], outputs["vectorized"])
+    speedup = timings["legacy"] / timings["vectorized"]
+    print(f"outputs identical, speedup {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--rows_per_page", type=int, default=50)
+    args = parser.parse_args()
+    run_benchmark(args.rows, args.rows_per_page)
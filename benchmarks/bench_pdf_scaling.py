@@ -0,0 +1,203 @@
+"""
+Scaling benchmark for the exercise 1 pdf pipeline. Synthetic WC Music Corp statements are
+generated at each page count, and determine_document_schema_type, get_page_data,
+format_pdf_data and validate_data are timed on each of them. The throughput of each stage is
+reported in pages per second and compared with a baseline, exiting with an error if any stage
+has slowed down by more than the tolerance. Run with --update_baseline to record a new
+baseline on the current machine.
+
+Usage:
+    python benchmarks/bench_pdf_scaling.py --pages 10 100 1000 5000
+"""
+import argparse
+import copy
+import json
+import pathlib
+import sys
+import tempfile
+import time
+
+from generate_wc_music_corp_pdf import generate_wc_music_corp_pdf
+from musicie.exercise_1_ingest_structure_pdf_royalty_statements.base_pdf_reader import (
+    determine_document_schema_type,
+)
+from musicie.exercise_1_ingest_structure_pdf_royalty_statements.task_1 import (
+    CONFIG,
+    get_class,
+)
+
+DEFAULT_BASELINE_PATH = pathlib.Path(__file__).parent / "pdf_scaling_baseline.json"
+STAGES = [
+    "determine_document_schema_type",
+    "get_page_data",
+    "format_pdf_data",
+    "validate_data",
+]
+
+
+def time_stage(timings: dict, stage: str, func, *args, repeats=1):
+    """
+    Function to time func, storing the fastest of the repeats against the stage. Each
+    repeat is run on a copy of the args, as the stages modify the page data they are given
+    """
+    timings[stage] = float("inf")
+    for _ in range(repeats):
+        repeat_args = copy.deepcopy(args) if repeats > 1 else args
+        start = time.perf_counter()
+        output = func(*repeat_args)
+        timings[stage] = min(timings[stage], time.perf_counter() - start)
+    return output
+
+
+def get_failed_validations(report_json_path: pathlib.Path) -> list:
+    """
+    Function to return the validations that failed, from the json validation report
+    """
+    with open(report_json_path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    return [
+        result["Test Type"]
+        for results in report["table_results"] + report["whole_document_results"]
+        for result in results
+        if result["Result"] != "Pass"
+    ]
+
+
+def run_pipeline(
+    pdf_path: pathlib.Path, output_folder: pathlib.Path, page_workers=1, repeats=5
+) -> dict:
+    """
+    Function to run each stage of the pipeline on a pdf, returning the seconds taken by each.
+    Page extraction is run once, and the other, much faster, stages are repeated
+    """
+    timings = {}
+    document_schema_type, front_page_data = time_stage(
+        timings,
+        "determine_document_schema_type",
+        determine_document_schema_type,
+        pdf_path,
+        repeats=repeats,
+    )
+    pdf_config = CONFIG[document_schema_type]
+    reader = get_class(document_schema_type, "reader")(
+        pdf_path,
+        page_workers=page_workers,
+        **pdf_config.get("read_pdf_config", {}),
+    )
+    formatter = get_class(document_schema_type, "formatter")(
+        pdf_config["format_pdf_config"]
+    )
+    page_data, page_table_numbers, no_pages = time_stage(
+        timings, "get_page_data", reader.get_page_data
+    )
+    pdf_data, formatted_page_table_numbers = time_stage(
+        timings,
+        "format_pdf_data",
+        formatter.format_pdf_data,
+        page_data,
+        page_table_numbers,
+        repeats=repeats,
+    )
+    validator = get_class(document_schema_type, "validator")(
+        pdf_config["validate_pdf_config"],
+        output_folder,
+        pdf_data,
+        formatted_page_table_numbers,
+        front_page_data,
+        no_pages,
+        report_mode="html",
+        report_json=True,
+    )
+    report_path = time_stage(
+        timings, "validate_data", validator.validate_data, repeats=repeats
+    )
+    failed_validations = get_failed_validations(report_path.with_suffix(".json"))
+    if failed_validations:
+        raise AssertionError(f"{pdf_path} failed validations: {failed_validations}")
+    return timings
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Function to find the stages whose pages per second have dropped below the baseline by
+    more than the tolerance
+    """
+    return [
+        f"{stage} at {n_pages} pages: {pages_per_second:,.1f} pages/s, "
+        f"baseline {baseline[n_pages][stage]:,.1f} pages/s"
+        for n_pages, stage_results in results.items()
+        for stage, pages_per_second in stage_results.items()
+        if stage in baseline.get(n_pages, {})
+        and pages_per_second < baseline[n_pages][stage] * (1 - tolerance)
+    ]
+
+
+def run_benchmark(
+    page_counts: list,
+    page_workers: int,
+    repeats: int,
+    baseline_path: pathlib.Path,
+    tolerance: float,
+    update_baseline: bool,
+) -> None:
+    """
+    Function to benchmark the pipeline at each page count, and check for regressions against
+    the baseline
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for n_pages in page_counts:
+            pdf_path = generate_wc_music_corp_pdf(
+                pathlib.Path(temp_dir) / f"wc_music_corp_{n_pages}.pdf", n_pages
+            )
+            timings = run_pipeline(
+                pdf_path,
+                pathlib.Path(temp_dir) / f"output_{n_pages}",
+                page_workers,
+                repeats,
+            )
+            results[str(n_pages)] = {
+                stage: n_pages / timings[stage] for stage in STAGES
+            }
+            for stage in STAGES:
+                print(
+                    f"{n_pages} pages - {stage}: {timings[stage]:.2f}s "
+                    f"({results[str(n_pages)][stage]:,.1f} pages/s)"
+                )
+
+    if update_baseline:
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"wrote baseline to {baseline_path}")
+        return
+    if not baseline_path.exists():
+        print(
+            f"no baseline at {baseline_path}, run with --update_baseline to record one"
+        )
+        return
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        regressions = find_regressions(results, json.load(f), tolerance)
+    if regressions:
+        sys.exit("throughput regressions:\n" + "\n".join(regressions))
+    print(f"no stage is more than {tolerance:.0%} slower than the baseline")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--page_workers", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument(
+        "--baseline_path", type=pathlib.Path, default=DEFAULT_BASELINE_PATH
+    )
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--update_baseline", action="store_true")
+    args = parser.parse_args()
+    run_benchmark(
+        args.pages,
+        args.page_workers,
+        args.repeats,
+        args.baseline_path,
+        args.tolerance,
+        args.update_baseline,
+    )
@@ -0,0 +1,193 @@
+"""
+Benchmark for the exercise 1 royalty store. Synthetic music_royalties tables are appended to
+a royalty store, one statement per month, until it holds the requested number of rows, and
+a set of typical aggregations, the same ones the musicie query command runs, are timed on
+it. The benchmark exits with an error if any aggregation takes longer than the limit.
+
+Usage:
+    python benchmarks/bench_royalty_store.py --rows 1000000 5000000
+"""
+
+import argparse
+import pathlib
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from musicie.exercise_1_ingest_structure_pdf_royalty_statements.royalty_store import (
+    ROYALTY_STORE_NAME,
+    RoyaltyStore,
+)
+
+INCOME_TYPES = [
+    "Physical Mechanical",
+    "Download Mechanical",
+    "Stream Mechanical",
+    "Stream Performance",
+    "TV Performance",
+    "Radio Performance",
+    "Synchronisation",
+    "Print",
+    "Other",
+]
+
+
+def generate_music_royalties(n_rows: int, n_scopes: int, n_tracks: int, seed: int):
+    """
+    Function to generate a synthetic music_royalties table with the columns written by
+    exercise 1
+    """
+    rng = np.random.default_rng(seed)
+    amount_received = rng.uniform(0, 2000, n_rows).round(3)
+    return pd.DataFrame(
+        {
+            "income_type": rng.choice(INCOME_TYPES, n_rows),
+            "statement_id": rng.integers(100000, 999999, n_rows),
+            "units": rng.integers(0, 50000, n_rows),
+            "amount_received": amount_received,
+            "royalty_rate": 50.0,
+            "amount_paid": (amount_received / 2).round(3),
+            "scope": [
+                f"SCOPE {scope:03d}" for scope in rng.integers(0, n_scopes, n_rows)
+            ],
+            "track_title": [
+                f"TRACK {track:06d}" for track in rng.integers(0, n_tracks, n_rows)
+            ],
+            "page_number": rng.integers(1, 1000, n_rows),
+        }
+    )
+
+
+def build_store(
+    store_path: pathlib.Path,
+    n_rows: int,
+    n_statements: int,
+    n_scopes: int,
+    n_tracks: int,
+) -> float:
+    """
+    Function to append n_statements monthly statements, holding n_rows between them, to the
+    store, returning the seconds taken
+    """
+    royalty_store = RoyaltyStore(store_path)
+    statement_dates = pd.date_range("2012-01-31", periods=n_statements, freq="M")
+    start = time.perf_counter()
+    for statement_number, statement_date in enumerate(statement_dates):
+        royalty_store.append_statement(
+            f"STATEMENT_{statement_date:%Y%m%d}",
+            statement_date,
+            {
+                "music_royalties": generate_music_royalties(
+                    n_rows // n_statements, n_scopes, n_tracks, statement_number
+                )
+            },
+        )
+    royalty_store.close()
+    return time.perf_counter() - start
+
+
+def get_queries() -> dict:
+    """
+    Function to return the aggregations to time, as keyword arguments of
+    RoyaltyStore.aggregate
+    """
+    return {
+        "track by quarter": {
+            "measures": ["amount_paid", "units"],
+            "group_by": ["statement_quarter"],
+            "filters": {"track_title": "TRACK 000042"},
+        },
+        "track by scope, last 8 quarters": {
+            "measures": ["amount_paid"],
+            "group_by": ["scope"],
+            "filters": {"track_title": "TRACK 000042"},
+            "last_quarters": 8,
+        },
+        "scope by income type, one statement": {
+            "measures": ["amount_received", "amount_paid"],
+            "group_by": ["income_type"],
+            "filters": {"scope": "SCOPE 007", "statement_date": "2015-06-30"},
+        },
+        "scopes, last quarter": {
+            "measures": ["amount_paid"],
+            "group_by": ["scope"],
+            "last_quarters": 1,
+        },
+        "scopes, last 4 quarters": {
+            "measures": ["amount_paid"],
+            "group_by": ["scope"],
+            "last_quarters": 4,
+        },
+    }
+
+
+def time_queries(store_path: pathlib.Path, repeats: int) -> dict:
+    """
+    Function to time each query against the store, returning the fastest of the repeats
+    """
+    royalty_store = RoyaltyStore(store_path)
+    timings = {}
+    for query_name, query_kwargs in get_queries().items():
+        timings[query_name] = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            royalty_store.aggregate("music_royalties", **query_kwargs)
+            timings[query_name] = min(timings[query_name], time.perf_counter() - start)
+    royalty_store.close()
+    return timings
+
+
+def run_benchmark(
+    row_counts: list,
+    n_statements: int,
+    n_scopes: int,
+    n_tracks: int,
+    repeats: int,
+    max_seconds: float,
+) -> None:
+    """
+    Function to benchmark the store at each row count, and check that every query is
+    faster than max_seconds
+    """
+    slow_queries = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for n_rows in row_counts:
+            store_path = pathlib.Path(temp_dir) / f"{n_rows}_{ROYALTY_STORE_NAME}"
+            append_seconds = build_store(
+                store_path, n_rows, n_statements, n_scopes, n_tracks
+            )
+            print(
+                f"{n_rows:,} rows - append: {append_seconds:.1f}s "
+                f"({n_rows / append_seconds:,.0f} rows/s)"
+            )
+            for query_name, seconds in time_queries(store_path, repeats).items():
+                print(f"{n_rows:,} rows - {query_name}: {seconds:.3f}s")
+                if seconds > max_seconds:
+                    slow_queries.append(
+                        f"{query_name} at {n_rows:,} rows: {seconds:.3f}s"
+                    )
+    if slow_queries:
+        sys.exit(f"queries slower than {max_seconds}s:\n" + "\n".join(slow_queries))
+    print(f"every query ran in under {max_seconds}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000000, 5000000])
+    parser.add_argument("--statements", type=int, default=120)
+    parser.add_argument("--scopes", type=int, default=20)
+    parser.add_argument("--tracks", type=int, default=20000)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--max_seconds", type=float, default=1.0)
+    args = parser.parse_args()
+    run_benchmark(
+        args.rows,
+        args.statements,
+        args.scopes,
+        args.tracks,
+        args.repeats,
+        args.max_seconds,
+    )
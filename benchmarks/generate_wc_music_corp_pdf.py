@@ -0,0 +1,446 @@
+"""
+Generator for synthetic royalty statements in the WC Music Corp layout. A statement has a
+front page, followed by the foreign tax summary, income type group summary, scope summary
+and music royalties sections, with one table per page. All of the amounts are generated in
+thousandths and summed exactly, so the generated statements pass every validation.
+
+Usage:
+    python benchmarks/generate_wc_music_corp_pdf.py --pages 1000 --output_path inputs/synthetic.pdf
+"""
+import argparse
+from collections import defaultdict
+import math
+import pathlib
+import random
+
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.pdfgen import canvas
+
+PAGE_SIZE = landscape(A4)
+FONT = "Helvetica"
+FONT_SIZE = 8
+LINE_HEIGHT = 12
+LEFT_MARGIN = 40
+TOP_MARGIN = 50
+FIRST_COL_WIDTH = 330
+COL_WIDTH = 90
+
+INCOME_TYPES = {
+    "Digital Mechanical": ["Download Mechanical", "Stream Mechanical"],
+    "Digital Performance": ["Stream Performance", "Online Performance"],
+    "Mechanical": ["Physical Mechanical"],
+    "Performance": ["Radio Performance", "TV Performance", "Live Performance"],
+    "Synchronisation": ["Sync Fee"],
+}
+TERRITORIES = [
+    "Argentina",
+    "Australia",
+    "Austria",
+    "Belgium",
+    "Brazil",
+    "Canada",
+    "Denmark",
+    "Finland",
+    "France",
+    "Germany",
+    "Ireland",
+    "Italy",
+    "Japan",
+    "Mexico",
+    "Netherlands",
+    "Norway",
+    "Poland",
+    "Portugal",
+    "Spain",
+    "Sweden",
+    "Switzerland",
+    "United Kingdom",
+    "United States",
+]
+TITLE_WORDS = [
+    "BLUE",
+    "SKY",
+    "LOVE",
+    "SONG",
+    "NIGHT",
+    "DRIVE",
+    "GOLDEN",
+    "HOUR",
+    "RIVER",
+    "FIRE",
+    "SUMMER",
+    "RAIN",
+    "CITY",
+    "LIGHTS",
+    "HEART",
+    "STONE",
+    "MIDNIGHT",
+    "SUN",
+]
+ROYALTY_RATE = 50
+ROYALTY_COLUMNS = [
+    "Income Type",
+    "Statement Id",
+    "Units",
+    "Amount Received",
+    "Royalty Rate",
+    "Amount Paid",
+]
+FOREIGN_TAX_COLUMNS = [
+    "Territory Name",
+    "Income Type Group",
+    "Gross Payable",
+    "Tax Rate",
+    "Withholding Tax",
+    "Net Payable",
+]
+INCOME_TYPE_GROUP_COLUMNS = [
+    "Income Type Group",
+    "Gross Payable",
+    "Withholding Tax",
+    "Net Payable",
+]
+SCOPE_COLUMNS = ["Scope Name", "Gross Payable", "Withholding Tax", "Net Payable"]
+
+
+def format_amount(amount: int, decimals=3) -> str:
+    """
+    Function to format an amount held in thousandths, with thousands separators
+    """
+    return f"{amount / 1000:,.{decimals}f}"
+
+
+def get_territory_tax_rates(n_territories: int, rnd: random.Random) -> dict:
+    """
+    Function to pick the territories of the statement and their withholding tax rates
+    """
+    territories = [
+        TERRITORIES[i % len(TERRITORIES)]
+        + ("" if i < len(TERRITORIES) else f" {i // len(TERRITORIES)}")
+        for i in range(n_territories)
+    ]
+    return {
+        territory: rnd.choice([0, 10, 15, 20, 25, 31.5]) for territory in territories
+    }
+
+
+def get_scope_names(n_scopes: int) -> list:
+    """
+    Function to return the names of the scopes of the statement
+    """
+    return [
+        f"US 065824000 SYNTHETIC ENTERPRISES LLC (Catalogue {i + 1:03d})"
+        for i in range(n_scopes)
+    ]
+
+
+def get_track_title(track_number: int, rnd: random.Random) -> str:
+    """
+    Function to return a unique upper case track title
+    """
+    return f"{rnd.choice(TITLE_WORDS)} {rnd.choice(TITLE_WORDS)} {track_number:06d}"
+
+
+def make_royalty_pages(
+    n_pages: int,
+    scopes: list,
+    tax_rates: dict,
+    tracks_per_page: int,
+    rows_per_track: int,
+    rnd: random.Random,
+) -> tuple:
+    """
+    Function to create the music royalties pages, returning the scope and table rows of each
+    page along with the royalty records they were built from
+    """
+    income_types = [
+        (group, income_type)
+        for group, group_income_types in INCOME_TYPES.items()
+        for income_type in group_income_types
+    ]
+    pages = []
+    records = []
+    for page_number in range(n_pages):
+        scope = scopes[page_number * len(scopes) // n_pages]
+        rows = []
+        for track in range(tracks_per_page):
+            title = get_track_title(page_number * tracks_per_page + track, rnd)
+            track_rows = []
+            track_received = track_paid = 0
+            for _ in range(rows_per_track):
+                group, income_type = rnd.choice(income_types)
+                territory = rnd.choice(list(tax_rates))
+                amount_received = rnd.randint(1, 2_000_000)
+                amount_paid = amount_received * ROYALTY_RATE // 100
+                track_received += amount_received
+                track_paid += amount_paid
+                records.append(
+                    {
+                        "scope": scope,
+                        "territory": territory,
+                        "income_type_group": group,
+                        "amount_paid": amount_paid,
+                        "withholding_tax": -round(
+                            amount_paid * tax_rates[territory] / 100
+                        ),
+                    }
+                )
+                track_rows.append(
+                    [
+                        income_type,
+                        str(rnd.randint(100000, 999999)),
+                        f"{rnd.randint(1, 50000):,}",
+                        format_amount(amount_received),
+                        f"{ROYALTY_RATE:.2f} @",
+                        format_amount(amount_paid),
+                    ]
+                )
+            rows.append(
+                [
+                    f"{title} - Synthetic Writer {format_amount(track_received)} "
+                    f"{format_amount(track_paid)}",
+                    "",
+                    "",
+                    "",
+                    "",
+                    "",
+                ]
+            )
+            rows.extend(track_rows)
+        pages.append({"scope": scope, "rows": rows})
+    return pages, records
+
+
+def sum_records(records: list, keys: list) -> dict:
+    """
+    Function to sum the amount paid and withholding tax of the royalty records by the keys
+    """
+    totals = defaultdict(lambda: [0, 0])
+    for record in records:
+        key = tuple(record[k] for k in keys)
+        totals[key][0] += record["amount_paid"]
+        totals[key][1] += record["withholding_tax"]
+    return totals
+
+
+def make_summary_row(name: list, gross_payable: int, withholding_tax: int) -> list:
+    """
+    Function to create a summary table row of the gross payable, withholding tax and net payable
+    """
+    return name + [
+        format_amount(gross_payable),
+        format_amount(withholding_tax),
+        format_amount(gross_payable + withholding_tax),
+    ]
+
+
+def make_foreign_tax_rows(records: list, tax_rates: dict) -> list:
+    """
+    Function to create the foreign tax summary rows, with a row for every income type group
+    and a subtotal for each territory
+    """
+    totals = sum_records(records, ["territory", "income_type_group"])
+    groups = list(INCOME_TYPES)
+    rows = []
+    for territory, tax_rate in tax_rates.items():
+        for i, group in enumerate(groups):
+            gross_payable, withholding_tax = totals[(territory, group)]
+            row = make_summary_row(
+                [territory if i == 0 else "", group], gross_payable, withholding_tax
+            )
+            rows.append(row[:3] + [f"{tax_rate}" if i == 0 else ""] + row[3:])
+        row = make_summary_row(
+            ["", f"All ({len(groups)} Types)"],
+            sum(totals[(territory, group)][0] for group in groups),
+            sum(totals[(territory, group)][1] for group in groups),
+        )
+        rows.append(row[:3] + [""] + row[3:])
+    total_row = make_summary_row(
+        ["Total", ""],
+        sum(record["amount_paid"] for record in records),
+        sum(record["withholding_tax"] for record in records),
+    )
+    return rows + [total_row[:3] + [""] + total_row[3:]]
+
+
+def make_grouped_rows(records: list, key: str, names: list) -> list:
+    """
+    Function to create the rows of a summary table grouped by a single key, with a total
+    """
+    totals = sum_records(records, [key])
+    rows = [make_summary_row([name], *totals[(name,)]) for name in names]
+    return rows + [
+        make_summary_row(
+            ["Total"],
+            sum(record["amount_paid"] for record in records),
+            sum(record["withholding_tax"] for record in records),
+        )
+    ]
+
+
+def chunk_rows(rows: list, rows_per_page: int) -> list:
+    """
+    Function to split table rows into pages
+    """
+    return [rows[i : i + rows_per_page] for i in range(0, len(rows), rows_per_page)]
+
+
+def draw_lines(pdf: canvas.Canvas, lines: list, y: float) -> float:
+    """
+    Function to draw lines of text from the top of the page, returning the next y position
+    """
+    for line in lines:
+        pdf.drawString(LEFT_MARGIN, y, line)
+        y -= LINE_HEIGHT
+    return y
+
+
+def draw_table(
+    pdf: canvas.Canvas, columns: list, rows: list, y: float, ruled=False
+) -> None:
+    """
+    Function to draw a table with a left aligned first column and right aligned numeric
+    columns, optionally ruled into cells
+    """
+    if ruled:
+        col_edges = [LEFT_MARGIN - 4] + [
+            LEFT_MARGIN + FIRST_COL_WIDTH + i * COL_WIDTH + 4
+            for i in range(len(columns))
+        ]
+        row_edges = [
+            y + LINE_HEIGHT - 3 - i * LINE_HEIGHT for i in range(len(rows) + 2)
+        ]
+        pdf.grid(col_edges, row_edges)
+    for row in [columns] + rows:
+        pdf.drawString(LEFT_MARGIN, y, row[0])
+        for i, value in enumerate(row[1:]):
+            pdf.drawRightString(
+                LEFT_MARGIN + FIRST_COL_WIDTH + (i + 1) * COL_WIDTH, y, value
+            )
+        y -= LINE_HEIGHT
+
+
+def draw_page(
+    pdf: canvas.Canvas, header_lines: list, columns: list, rows: list, ruled=False
+) -> None:
+    """
+    Function to draw a page made up of header lines followed by a single table
+    """
+    pdf.setFont(FONT, FONT_SIZE)
+    y = draw_lines(pdf, header_lines, PAGE_SIZE[1] - TOP_MARGIN)
+    draw_table(pdf, columns, rows, y - LINE_HEIGHT, ruled)
+    pdf.showPage()
+
+
+def draw_front_page(
+    pdf: canvas.Canvas, statement_no: str, date: str, amount_due: int
+) -> None:
+    """
+    Function to draw the front page, whose first line and key: value lines are parsed by
+    format_wc_music_corp, and whose balance table holds the closing balance and amount due
+    """
+    draw_page(
+        pdf,
+        [
+            "WC Music Corp.",
+            "1 Synthetic Street",
+            "London",
+            "W1 1AA",
+            "United Kingdom",
+            "Payee: Synthetic Writer",
+            f"Statement/Invoice No: {statement_no}",
+            "Currency: USD",
+            date,
+        ],
+        ["Balance", "Amount"],
+        [
+            ["Opening Balance", "0.00"],
+            ["Closing Balance", format_amount(amount_due, 2)],
+            ["Amount Due", format_amount(amount_due, 2)],
+        ],
+        ruled=True,
+    )
+
+
+def generate_wc_music_corp_pdf(  # pylint:disable=too-many-locals
+    output_path: pathlib.Path,
+    n_pages: int,
+    n_scopes=4,
+    n_territories=12,
+    tracks_per_page=5,
+    rows_per_track=6,
+    rows_per_page=35,
+    statement_no="20204US 065824000 001",
+    date="2021-02-28",
+    seed=0,
+) -> pathlib.Path:
+    """
+    Function to write a synthetic WC Music Corp statement with n_pages pages. The summary
+    sections take up as many pages as their rows need, and the rest are music royalties pages
+    """
+    rnd = random.Random(seed)
+    scopes = get_scope_names(n_scopes)
+    tax_rates = get_territory_tax_rates(n_territories, rnd)
+    income_type_group_pages = math.ceil((len(INCOME_TYPES) + 1) / rows_per_page)
+    scope_pages = math.ceil((n_scopes + 1) / rows_per_page)
+    # every territory has a row per income type group and a subtotal
+    foreign_tax_pages = math.ceil(
+        (n_territories * (len(INCOME_TYPES) + 1) + 1) / rows_per_page
+    )
+    n_royalty_pages = (
+        n_pages - 1 - foreign_tax_pages - income_type_group_pages - scope_pages
+    )
+    if n_royalty_pages < n_scopes:
+        raise ValueError(
+            f"{n_pages} pages is too few for {n_scopes} scopes and {n_territories} territories"
+        )
+    royalty_pages, records = make_royalty_pages(
+        n_royalty_pages, scopes, tax_rates, tracks_per_page, rows_per_track, rnd
+    )
+
+    pathlib.Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    pdf = canvas.Canvas(str(output_path), pagesize=PAGE_SIZE)
+    draw_front_page(
+        pdf,
+        statement_no,
+        date,
+        sum(record["amount_paid"] + record["withholding_tax"] for record in records),
+    )
+    for rows in chunk_rows(make_foreign_tax_rows(records, tax_rates), rows_per_page):
+        draw_page(pdf, ["Foreign Tax Summary"], FOREIGN_TAX_COLUMNS, rows)
+    for rows in chunk_rows(
+        make_grouped_rows(records, "income_type_group", list(INCOME_TYPES)),
+        rows_per_page,
+    ):
+        draw_page(pdf, ["Income Type Group Summary"], INCOME_TYPE_GROUP_COLUMNS, rows)
+    for rows in chunk_rows(make_grouped_rows(records, "scope", scopes), rows_per_page):
+        draw_page(pdf, ["Scope Summary"], SCOPE_COLUMNS, rows)
+    for page in royalty_pages:
+        draw_page(
+            pdf, ["Music Royalties", page["scope"]], ROYALTY_COLUMNS, page["rows"]
+        )
+    pdf.save()
+    return pathlib.Path(output_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--scopes", type=int, default=4)
+    parser.add_argument("--territories", type=int, default=12)
+    parser.add_argument("--tracks_per_page", type=int, default=5)
+    parser.add_argument("--rows_per_track", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output_path", type=pathlib.Path, required=True)
+    args = parser.parse_args()
+    print(
+        generate_wc_music_corp_pdf(
+            args.output_path,
+            args.pages,
+            n_scopes=args.scopes,
+            n_territories=args.territories,
+            tracks_per_page=args.tracks_per_page,
+            rows_per_track=args.rows_per_track,
+            seed=args.seed,
+        )
+    )
@@ -1,8 +1,10 @@
 import argparse
+import importlib
 from pathlib import Path
+import sys
+import time
 
-from musicie.exercise_1_ingest_structure_pdf_royalty_statements import task_1
-from musicie.exercise_3_artist_recording_universe import task_3
+from musicie.instrumentation import span, start_profiling, write_profile
 
 
 def argument_parser():
@@ -17,6 +19,63 @@ def argument_parser():
         choices=[1, 3],
         help="Number of the exercise to run",
     )
+    add_shared_arguments(parser)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        required=False,
+        default=1,
+        help="""Number of processes to read, format and validate pdfs across (exercise 1
+        only). If greater than 1, these stages run in a process pool.""",
+    )
+    parser.add_argument(
+        "--stage_workers",
+        type=parse_stage_workers,
+        nargs="+",
+        required=False,
+        default=[],
+        help="""Number of workers of a stage of the exercise 1 pipeline, as stage=n, for the
+        read, format, validate and write stages. pdfs are read, formatted and validated
+        across --workers processes, and written by a single thread.""",
+    )
+    parser.add_argument(
+        "--queue_size",
+        type=int,
+        required=False,
+        default=1,
+        help="""Number of pdfs that can wait between each pair of stages of the exercise 1
+        pipeline, before the earlier stage blocks.""",
+    )
+    parser.add_argument(
+        "--report_mode",
+        type=str,
+        required=False,
+        default="pdf",
+        choices=["pdf", "html", "deferred_pdf"],
+        help="""How to write the quality report for each pdf (exercise 1 only). pdf renders each
+        report to pdf as it is validated, html only writes html reports, and deferred_pdf writes
+        html reports and converts them all to pdf at the end of the run, running one wkhtmltopdf
+        process per report, --workers at a time.""",
+    )
+
+    return parser.parse_args()
+
+
+def parse_stage_workers(stage_workers: str) -> tuple:
+    """
+    Function to parse a stage=n argument into a (stage, n) pair
+    """
+    stage, workers = stage_workers.split("=")
+    if stage not in {"read", "format", "validate", "write"}:
+        raise argparse.ArgumentTypeError(f"unknown pipeline stage {stage}")
+    return stage, int(workers)
+
+
+def add_shared_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Function to add the cli arguments shared by the exercise run and the ingest-daemon
+    command to a parser
+    """
     parser.add_argument(
         "--input_folder_location",
         type=str,
@@ -24,6 +83,13 @@ def argument_parser():
         default=Path(__file__).parent.parent / "inputs",
         help="Location of the folder containing inputs",
     )
+    parser.add_argument(
+        "--output_folder_location",
+        type=str,
+        required=False,
+        default=Path.home() / "Downloads" / "jack_ballinger_task_outputs",
+        help="Location of the folder to write outputs to",
+    )
     parser.add_argument(
         "--write_mode",
         type=bool,
@@ -31,6 +97,19 @@ def argument_parser():
         default=False,
         help="Boolean flag that when true, will write output data to file",
     )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="""Boolean flag that when set, will time each stage of the run and write a json
+        trace (trace.json) and a prometheus snapshot (metrics.prom) to the profile folder in
+        the output folder.""",
+    )
+    parser.add_argument(
+        "--parquet",
+        action="store_true",
+        help="""Boolean flag that when set, will also write output data to parquet files,
+        typed from the database schema, alongside the csv files (requires write_mode).""",
+    )
     parser.add_argument(
         "--postgres_yaml",
         type=str,
@@ -47,31 +126,345 @@ def argument_parser():
         help="""Location of a .aws/config file.
         If specified, code will attempt to write to s3.""",
     )
+    parser.add_argument(
+        "--page_workers",
+        type=int,
+        required=False,
+        default=1,
+        help="""Number of processes to extract the pages of a single pdf across (exercise 1 only).
+        Large pdfs are split into page ranges, one per process.""",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="""Boolean flag that when set, will skip pdfs whose contents have already been
+        loaded into sql (exercise 1 only, requires write_mode and postgres_yaml), and upsert
+        the rest by their UniqueId rather than truncating each table.""",
+    )
+    parser.add_argument(
+        "--no_cache",
+        "--no-cache",
+        action="store_true",
+        help="""Boolean flag that when set, will re-extract every pdf (exercise 1 only)
+        rather than reusing page data cached from a previous run. This also turns off the
+        page journal, so an interrupted extraction starts again from the first page, and the
+        next run re-extracts every page rather than only those that failed.""",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="""Boolean flag that when set, will stream pages from each pdf into the formatter
+        (exercise 1 only), so only one table section is held in memory at once.""",
+    )
+    parser.add_argument(
+        "--report_json",
+        action="store_true",
+        help="""Boolean flag that when set, will also write each quality report as json
+        (exercise 1 only), including every row of each test calculation.""",
+    )
+
+
+def ingest_daemon_argument_parser(argv: list):
+    """
+    Function to parse input cli arguments for the ingest-daemon command
+    """
+    parser = argparse.ArgumentParser(
+        prog="musicie ingest-daemon",
+        description="""Watch the input folder for new royalty statement pdfs, queue them in a
+        sqlite job queue, and ingest them (exercise 1) across a pool of worker processes.""",
+    )
+    add_shared_arguments(parser)
+    parser.add_argument(
+        "--queue_db",
+        type=str,
+        required=False,
+        default=None,
+        help="""Location of the sqlite job queue.
+        Defaults to ingest_queue.sqlite in the output folder.""",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        required=False,
+        default=1,
+        help="Number of processes to ingest pdfs across",
+    )
+    parser.add_argument(
+        "--report_mode",
+        type=str,
+        required=False,
+        default="html",
+        choices=["pdf", "html"],
+        help="How to write the quality report for each pdf",
+    )
+    parser.add_argument(
+        "--poll_interval",
+        type=float,
+        required=False,
+        default=10.0,
+        help="Number of seconds between scans of the input folder",
+    )
+    parser.add_argument(
+        "--settle_seconds",
+        type=float,
+        required=False,
+        default=5.0,
+        help="""Number of seconds a pdf must go unmodified before it is queued,
+        so that pdfs still being copied in aren't picked up""",
+    )
+    parser.add_argument(
+        "--max_attempts",
+        type=int,
+        required=False,
+        default=3,
+        help="Number of times to try ingesting a pdf before marking it as failed",
+    )
+    parser.add_argument(
+        "--retry_delay",
+        type=float,
+        required=False,
+        default=30.0,
+        help="Number of seconds before the first retry of a failed pdf, doubling each retry",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Boolean flag that when set, will stop the daemon once the queue has been drained",
+    )
+    parser.add_argument(
+        "--status",
+        action="store_true",
+        help="Boolean flag that when set, will print the queue depth and failed jobs and exit",
+    )
+
+    return parser.parse_args(argv)
+
+
+def ingest_daemon_cli(argv: list):
+    """
+    cli to run the exercise 1 ingest daemon
+    """
+    args = ingest_daemon_argument_parser(argv)
+    # imported here so that the pdf libraries are only loaded when the daemon is run
+    ingest_daemon = importlib.import_module(
+        "musicie.exercise_1_ingest_structure_pdf_royalty_statements.ingest_daemon"
+    )
+    queue_db = (
+        Path(args.queue_db)
+        if args.queue_db is not None
+        else Path(args.output_folder_location) / "ingest_queue.sqlite"
+    )
+    if args.status:
+        job_queue = ingest_daemon.JobQueue(queue_db)
+        print(job_queue.get_queue_depth())
+        for pdf_path, attempts, error in job_queue.get_failed_jobs():
+            print(f"{pdf_path} failed after {attempts} attempts: {error}")
+        job_queue.close()
+        return
+    if args.write_mode and args.postgres_yaml is not None and not args.incremental:
+        sys.exit(ingest_daemon.SQL_NEEDS_INCREMENTAL + ", set --incremental")
+    if args.profile:
+        start_profiling(Path(args.output_folder_location) / "profile")
+    try:
+        ingest_daemon.run_daemon(
+            args.input_folder_location,
+            args.output_folder_location,
+            queue_db,
+            write_mode=args.write_mode,
+            database_config=args.postgres_yaml,
+            aws_config=args.aws_config,
+            write_parquet=args.parquet,
+            incremental=args.incremental,
+            workers=args.workers,
+            poll_interval=args.poll_interval,
+            settle_seconds=args.settle_seconds,
+            max_attempts=args.max_attempts,
+            retry_delay=args.retry_delay,
+            once=args.once,
+            page_workers=args.page_workers,
+            use_cache=not args.no_cache,
+            stream=args.stream,
+            report_mode=args.report_mode,
+            report_json=args.report_json,
+        )
+    finally:
+        if args.profile:
+            write_profile(Path(args.output_folder_location) / "profile")
+
+
+def parse_filter(column_value: str) -> tuple:
+    """
+    Function to parse a column=value argument into a (column, value) pair
+    """
+    if "=" not in column_value:
+        raise argparse.ArgumentTypeError(f"expected column=value, got {column_value}")
+    column, value = column_value.split("=", 1)
+    return column, value
+
+
+def query_argument_parser(argv: list):
+    """
+    Function to parse input cli arguments for the query command
+    """
+    parser = argparse.ArgumentParser(
+        prog="musicie query",
+        description="""Aggregate the royalty statements ingested by exercise 1 from the
+        royalty store in the output folder, without reloading the csv outputs.""",
+    )
     parser.add_argument(
         "--output_folder_location",
         type=str,
         required=False,
         default=Path.home() / "Downloads" / "jack_ballinger_task_outputs",
-        help="Location of the folder to write outputs to",
+        help="Location of the folder that exercise 1 wrote outputs to",
+    )
+    parser.add_argument(
+        "--store",
+        type=str,
+        required=False,
+        default=None,
+        help="""Location of the royalty store.
+        Defaults to royalty_store.sqlite in the output folder.""",
+    )
+    parser.add_argument(
+        "--sql",
+        type=str,
+        required=False,
+        default=None,
+        help="""A sql query to run against the store.
+        If specified, the other query arguments are ignored.""",
+    )
+    parser.add_argument(
+        "--table",
+        type=str,
+        required=False,
+        default="music_royalties",
+        help="Table of the store to aggregate",
+    )
+    parser.add_argument(
+        "--sum",
+        type=str,
+        nargs="+",
+        required=False,
+        default=["amount_paid"],
+        help="Columns to sum",
+    )
+    parser.add_argument(
+        "--group_by",
+        type=str,
+        nargs="*",
+        required=False,
+        default=[],
+        help="Columns to group the sums by, e.g. statement_quarter scope",
+    )
+    parser.add_argument(
+        "--where",
+        type=parse_filter,
+        nargs="*",
+        required=False,
+        default=[],
+        help="Column values to filter the rows by, as column=value",
+    )
+    parser.add_argument(
+        "--last_quarters",
+        type=int,
+        required=False,
+        default=None,
+        help="""Number of quarters, up to the latest statement in the store, to aggregate
+        over. Defaults to every statement.""",
     )
 
-    return parser.parse_args()
+    return parser.parse_args(argv)
+
+
+def query_cli(argv: list):
+    """
+    cli to aggregate the royalty store written by exercise 1
+    """
+    args = query_argument_parser(argv)
+    # imported here so that the other commands don't pay for pandas
+    royalty_store_module = importlib.import_module(
+        "musicie.exercise_1_ingest_structure_pdf_royalty_statements.royalty_store"
+    )
+    store_path = (
+        Path(args.store)
+        if args.store is not None
+        else Path(args.output_folder_location) / royalty_store_module.ROYALTY_STORE_NAME
+    )
+    if not store_path.exists():
+        sys.exit(
+            f"no royalty store at {store_path}, run exercise 1 with write_mode first"
+        )
+    royalty_store = royalty_store_module.RoyaltyStore(store_path)
+    start = time.perf_counter()
+    try:
+        if args.sql is not None:
+            result = royalty_store.query(args.sql)
+        else:
+            result = royalty_store.aggregate(
+                args.table,
+                args.sum,
+                group_by=args.group_by,
+                filters=dict(args.where),
+                last_quarters=args.last_quarters,
+            )
+    except KeyError as error:
+        sys.exit(error.args[0])
+    finally:
+        royalty_store.close()
+    print(result.to_string(index=False))
+    print(f"{len(result)} rows in {time.perf_counter() - start:.3f}s", file=sys.stderr)
 
 
 def cli():
     """
     cli to run code locally
     """
+    if len(sys.argv) > 1 and sys.argv[1] in command_dict:
+        command_dict[sys.argv[1]](sys.argv[2:])
+        return
     args = argument_parser()
-    exercise_selected = exercise_dict[args.exercise_number]
-    exercise_selected.run_exercise(
-        args.input_folder_location,
-        args.output_folder_location,
-        args.write_mode,
-        args.postgres_yaml,
+    # exercises are imported once selected, so that --help and the other exercise don't
+    # pay for their imports
+    exercise_selected = importlib.import_module(exercise_dict[args.exercise_number])
+    exercise_kwargs = (
+        {
+            "write_parquet": args.parquet,
+            "workers": args.workers,
+            "page_workers": args.page_workers,
+            "use_cache": not args.no_cache,
+            "stream": args.stream,
+            "report_mode": args.report_mode,
+            "report_json": args.report_json,
+            "stage_workers": dict(args.stage_workers),
+            "queue_size": args.queue_size,
+            "incremental": args.incremental,
+        }
+        if args.exercise_number == 1
+        else {"write_parquet": args.parquet}
     )
+    if args.profile:
+        start_profiling(Path(args.output_folder_location) / "profile")
+    try:
+        with span("run", exercise_number=args.exercise_number):
+            exercise_selected.run_exercise(
+                args.input_folder_location,
+                args.output_folder_location,
+                args.write_mode,
+                args.postgres_yaml,
+                args.aws_config,
+                **exercise_kwargs,
+            )
+    finally:
+        if args.profile:
+            write_profile(Path(args.output_folder_location) / "profile")
+
+exercise_dict = {
+    1: "musicie.exercise_1_ingest_structure_pdf_royalty_statements.task_1",
+    3: "musicie.exercise_3_artist_recording_universe.task_3",
+}
 
-exercise_dict = {1: task_1, 3: task_3}
+command_dict = {"ingest-daemon": ingest_daemon_cli, "query": query_cli}
 
 if __name__ == "__main__":
     cli()
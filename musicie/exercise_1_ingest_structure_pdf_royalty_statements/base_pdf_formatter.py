@@ -1,9 +1,11 @@
 from abc import abstractmethod
+from collections.abc import Mapping
 import logging
 import re
 
 import pandas as pd
 from pandas.core.frame import DataFrame
+import pyarrow as pa
 
 logging.basicConfig(level=logging.INFO)
 _LOGGER = logging.getLogger(__file__)
@@ -17,9 +19,56 @@ class BasePDFFormatter:
         self._config = config
         self._ignore_tables = self._config.get("ignore_tables", 0)
         self._table_config = self._config["tables"]
-        self._func_list = {
-            table: [FUNC_DICT[k] for k in functions if k != "enhance_table_data"]
-            for table, functions in self._table_config.items()
+        self._format_plans = {
+            table: get_format_plan(table, table_config)
+            for table, table_config in self._table_config.items()
+        }
+        self._table_signatures = {
+            tuple(table_config["columns"]): table
+            for table, table_config in self._table_config.items()
+            if "columns" in table_config
+        }
+
+    def get_parquet_schemas(self) -> dict:
+        """
+        Function to return the arrow schema of each config table, for writing it to parquet
+        """
+        return {
+            table: get_table_parquet_schema(table_config)
+            for table, table_config in self._table_config.items()
+        }
+
+    def get_table_name(self, schema: tuple, schema_index: int):
+        """
+        Function to route a table to its config table by hashing its normalized column names.
+        Tables whose columns don't match any config table fall back to the position of their
+        schema in the document, after the ignored tables
+        """
+        table_name = self._table_signatures.get(get_table_signature(schema))
+        if table_name is not None:
+            return table_name
+        table_index = schema_index - self._ignore_tables
+        table_names = list(self._table_config)
+        if 0 <= table_index < len(table_names):
+            return table_names[table_index]
+        return None
+
+    def route_tables(self, input_page_table_numbers: dict) -> dict:
+        """
+        Function to map each config table to the table numbers of the schema routed to it,
+        in config order
+        """
+        routed_tables = {}
+        for schema_index, (schema, page_table_numbers) in enumerate(
+            input_page_table_numbers.items()
+        ):
+            table_name = self.get_table_name(schema, schema_index)
+            if table_name is not None:
+                routed_tables.setdefault(table_name, page_table_numbers)
+        return {
+            table_name: routed_tables[table_name]
+            for table_name in self._table_config
+            if table_name in routed_tables
         }
 
     def apply_table_formatting(self, input_df: pd.DataFrame, table_name: str) -> dict:
@@ -28,25 +77,32 @@ class BasePDFFormatter:
         """
         formatted_df = input_df.copy()
         _LOGGER.info("formatting pdf tables")
-        for func, args in zip(
-            self._func_list[table_name],
-            [
-                v
-                for k, v in self._table_config[table_name].items()
-                if k != "enhance_table_data"
-            ],
-        ):
-            if isinstance(args, bool):
-                formatted_df = func(formatted_df)
-            elif isinstance(args, (str, int, float)):
-                formatted_df = func(formatted_df, args)
-            elif isinstance(args, dict):
-                formatted_df = func(formatted_df, **args)
+        for func, args, kwargs in self._format_plans[table_name]:
+            formatted_df = func(formatted_df, *args, **kwargs)
         return {
             "table_name": table_name,
             "df": formatted_df.reset_index(drop=True),
         }
 
+    def compact_pdf_data(self, pdf_data: dict) -> dict:
+        """
+        Function to shrink the formatted tables to the compact dtypes set in the config,
+        logging the memory used by the tables before and after
+        """
+        memory_before = get_memory_usage(pdf_data)
+        compacted_pdf_data = {
+            table_name: compact_dtypes(
+                table, **self._table_config[table_name].get("compact_dtypes", {})
+            )
+            for table_name, table in pdf_data.items()
+        }
+        memory_after = get_memory_usage(compacted_pdf_data)
+        _LOGGER.info(
+            f"compacted pdf tables from {memory_before / 1e6:.2f}MB to "
+            f"{memory_after / 1e6:.2f}MB"
+        )
+        return compacted_pdf_data
+
     @abstractmethod
     def enhance_table_data(self, page_data_list, enhance_table_data_config, prev_tables):
         """
@@ -61,6 +117,14 @@ class BasePDFFormatter:
         """
         raise NotImplementedError
 
+    @abstractmethod
+    def format_pdf_data_stream(self, input_page_iterator):
+        """
+        Function to format any data to be written to pdf as pages are streamed in.
+        Must be overridden
+        """
+        raise NotImplementedError
+
 
 def drop_first_rows(input_df: pd.DataFrame, n: int) -> pd.DataFrame:
     """
@@ -78,11 +142,18 @@ def drop_last_rows(input_df: pd.DataFrame, n: int) -> pd.DataFrame:
 
 def replace_values(input_df: pd.DataFrame, replace_config: dict) -> pd.DataFrame:
     """
-    Function to replace any values as specified in the config
+    Function to replace any values as specified in the config. If cols are specified,
+    only those columns have their values replaced
     """
+    replace_cols = replace_config.get("cols", None)
     for k, v in replace_config.items():
         if k != "cols":
-            input_df = input_df.replace(k, v, regex=True)
+            if replace_cols is None:
+                input_df = input_df.replace(k, v, regex=True)
+            else:
+                input_df[replace_cols] = input_df[replace_cols].replace(
+                    k, v, regex=True
+                )
     return input_df
 
 
@@ -93,6 +164,30 @@ def col_types(input_df: pd.DataFrame, type_mappings: dict) -> DataFrame:
     return input_df.astype(type_mappings)
 
 
+def parse_col_types(
+    input_df: pd.DataFrame, type_mappings: dict, replace_config: dict
+) -> pd.DataFrame:
+    """
+    Function to replace values in, and then cast, each of the columns in the type_mappings.
+    If cols are specified in the replace_config, only those columns have their values
+    replaced. Replacements are only run on the string values of each column, and each column
+    is updated in place rather than copying the whole dataframe
+    """
+    replace_cols = replace_config.get("cols", list(type_mappings))
+    for col, col_type in type_mappings.items():
+        col_values = input_df[col]
+        if col in replace_cols and (
+            pd.api.types.infer_dtype(col_values, skipna=True) in STRING_DTYPES
+        ):
+            for k, v in replace_config.items():
+                if k != "cols":
+                    col_values = col_values.str.replace(k, v, regex=True).fillna(
+                        col_values
+                    )
+        input_df[col] = col_values.astype(col_type)
+    return input_df
+
+
 def fill_na_values(input_df: pd.DataFrame, how: dict) -> pd.DataFrame:
     """
     Function to fill any null values as specified in the config
@@ -109,21 +204,225 @@ def query_df(input_df: pd.DataFrame, query_string=None) -> pd.DataFrame:
     return input_df.query(query_string, engine="python")
 
 
-def normalize_column_names(input_df: pd.DataFrame) -> pd.DataFrame:
+def normalize_column_name(col: str) -> str:
     """
-    Function to normalze columns names to snake case
+    Function to normalize a column name to snake case
     """
-    input_df.columns = [
+    return (
         re.sub("([a-z0-9])([A-Z])", r"\1_\2", col)
         .lower()
         .strip()
         .replace(" ", "_")
         .replace("\r", "_")
-        for col in input_df.columns
-    ]
+    )
+
+
+def normalize_column_names(input_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Function to normalze columns names to snake case
+    """
+    input_df.columns = [normalize_column_name(col) for col in input_df.columns]
     return input_df
 
 
+def get_table_signature(schema: tuple) -> tuple:
+    """
+    Function to return the signature a table is routed by, its normalized column names
+    """
+    return tuple(normalize_column_name(str(col)) for col in schema)
+
+
+def compile_format_plan(table_config: dict) -> list:
+    """
+    Function to compile a table config into a list of (function, args, kwargs) steps, in the
+    order they are configured. A replace_values step directly followed by col_types is fused
+    into the cast, with the replacements restricted to the cast columns, unless cols are
+    specified in the replace_config. Any specified cols that aren't cast are replaced in a
+    separate step just before the fused cast
+    """
+    type_mappings = table_config.get("col_types", {}).get("type_mappings", {})
+    func_names = [
+        func_name
+        for func_name in table_config
+        if func_name not in ("columns", "enhance_table_data", "compact_dtypes")
+    ]
+    fuse_replace_values = ("replace_values", "col_types") in zip(
+        func_names, func_names[1:]
+    )
+    format_plan = []
+    for func_name in func_names:
+        args = table_config[func_name]
+        if func_name == "replace_values" and fuse_replace_values:
+            replace_config = dict(args["replace_config"])
+            replace_cols = replace_config.pop("cols", list(type_mappings))
+            unfused_cols = [col for col in replace_cols if col not in type_mappings]
+            if unfused_cols:
+                format_plan.append(
+                    (
+                        replace_values,
+                        (),
+                        {"replace_config": {**replace_config, "cols": unfused_cols}},
+                    )
+                )
+            format_plan.append(
+                (
+                    parse_col_types,
+                    (),
+                    {
+                        **table_config["col_types"],
+                        "replace_config": {
+                            **replace_config,
+                            "cols": [
+                                col for col in replace_cols if col in type_mappings
+                            ],
+                        },
+                    },
+                )
+            )
+        elif func_name == "col_types" and fuse_replace_values:
+            continue
+        elif isinstance(args, bool):
+            format_plan.append((FUNC_DICT[func_name], (), {}))
+        elif isinstance(args, (str, int, float)):
+            format_plan.append((FUNC_DICT[func_name], (args,), {}))
+        elif isinstance(args, dict):
+            format_plan.append((FUNC_DICT[func_name], (), args))
+    return format_plan
+
+
+def get_format_plan(table_name: str, table_config: dict) -> list:
+    """
+    Function to return the compiled format plan for a table, compiling it on first use
+    """
+    plan_key = (table_name, repr(table_config))
+    if plan_key not in COMPILED_FORMAT_PLANS:
+        COMPILED_FORMAT_PLANS[plan_key] = compile_format_plan(table_config)
+    return COMPILED_FORMAT_PLANS[plan_key]
+
+
+def get_memory_usage(pdf_data: dict) -> int:
+    """
+    Function to return the bytes of memory used by a dictionary of tables
+    """
+    return sum(
+        int(table.memory_usage(index=True, deep=True).sum())
+        for table in pdf_data.values()
+    )
+
+
+def compact_dtypes(
+    input_df: pd.DataFrame,
+    categories=(),
+    integers=(),
+    money=(),
+    money_scale=1000,
+) -> pd.DataFrame:
+    """
+    Function to convert repeated string columns to categoricals, downcast integer columns,
+    and store money columns as int64 multiples of 1 / money_scale. A money column is only
+    scaled if every value is restored exactly by dividing by money_scale, so values with
+    more decimals than money_scale holds are kept as they are. The formatted dtypes and
+    money scales are recorded in the dataframe attrs, so that expand_dtypes can restore them
+    """
+    compacted_df = input_df.copy()
+    for col in categories:
+        compacted_df[col] = compacted_df[col].astype("category")
+    for col in integers:
+        compacted_df[col] = pd.to_numeric(compacted_df[col], downcast="integer")
+    money_scales = {}
+    for col in money:
+        values = pd.to_numeric(compacted_df[col])
+        scaled_values = (values * money_scale).round()
+        if not ((scaled_values / money_scale == values) | values.isna()).all():
+            _LOGGER.info(f"{col} has values finer than 1 / {money_scale}, not scaling it")
+            continue
+        compacted_df[col] = scaled_values.astype(
+            "Int64" if scaled_values.hasnans else "int64"
+        )
+        money_scales[col] = money_scale
+    compacted_df.attrs["formatted_dtypes"] = {
+        col: input_df[col].dtype for col in [*categories, *integers]
+    }
+    compacted_df.attrs["money_scale"] = money_scales
+    return compacted_df
+
+
+def expand_dtypes(input_df: pd.DataFrame, money_only=False) -> pd.DataFrame:
+    """
+    Function to restore the formatted dtypes of a table compacted by compact_dtypes, so that
+    the table is written with the same column types as before it was compacted. If
+    money_only is set, only the money columns are restored, and the categoricals and
+    downcast integers are kept, for sinks that store them as they are
+    """
+    if not input_df.attrs:
+        return input_df
+    formatted_dtypes = {} if money_only else input_df.attrs.get("formatted_dtypes", {})
+    expanded_df = input_df.astype(formatted_dtypes).assign(
+        **{
+            col: input_df[col].astype("float64") / scale
+            for col, scale in input_df.attrs.get("money_scale", {}).items()
+        }
+    )
+    expanded_df.attrs = {}
+    return expanded_df
+
+
+class ExpandedTables(Mapping):
+    """
+    Class to read a dictionary of tables compacted by compact_dtypes, expanding each table
+    only when it is read, so that a sink writing one table at a time only holds one
+    expanded table in memory at once
+    """
+
+    def __init__(self, input_tables: dict, money_only=False):
+        self._input_tables = input_tables
+        self._money_only = money_only
+
+    def __getitem__(self, table_name: str) -> pd.DataFrame:
+        return expand_dtypes(self._input_tables[table_name], self._money_only)
+
+    def __iter__(self):
+        return iter(self._input_tables)
+
+    def __len__(self) -> int:
+        return len(self._input_tables)
+
+
+def get_table_parquet_schema(table_config: dict) -> pa.Schema:
+    """
+    Function to create the arrow schema of a formatted table from its config. The table's
+    columns, and the columns compacted to categoricals, are strings, and the compacted
+    integer and money columns are int64 and float64, unless cast to another type in
+    col_types
+    """
+    compact_config = table_config.get("compact_dtypes", {})
+    col_types = {
+        **{
+            normalize_column_name(col): pa.string()
+            for col in [
+                *table_config.get("columns", []),
+                *compact_config.get("categories", []),
+            ]
+        },
+        **{col: pa.int64() for col in compact_config.get("integers", [])},
+        **{col: pa.float64() for col in compact_config.get("money", [])},
+        **{
+            col: CONFIG_ARROW_TYPES[col_type]
+            for col, col_type in table_config.get("col_types", {})
+            .get("type_mappings", {})
+            .items()
+        },
+    }
+    return pa.schema(list(col_types.items()))
+
+
+COMPILED_FORMAT_PLANS = {}
+
+# the arrow types of the types that columns are cast to in col_types
+CONFIG_ARROW_TYPES = {"float": pa.float64(), "int": pa.int64(), "str": pa.string()}
+
+STRING_DTYPES = ("string", "mixed", "mixed-integer")
+
 FUNC_DICT = {
     "drop_last_rows": drop_last_rows,
     "drop_first_rows": drop_first_rows,
@@ -135,19 +434,18 @@ FUNC_DICT = {
 }
 
 
-def format_front_page(schema_type: str, front_page_text: str) -> dict:
+def format_front_page(schema_type: str, front_page_lines: list) -> dict:
     """
     Function to match the correct front page formatting function with the correct schema_type.
     The function will then fun the formatting on the front page
     """
-    return front_page_parsing_dict[schema_type](front_page_text)
+    return front_page_parsing_dict[schema_type](front_page_lines)
 
 
-def format_wc_music_corp(input_text: str) -> dict:
+def format_wc_music_corp(front_page_split: list) -> dict:
     """
     Function to format the front page of pdfs from WC Music Corp.
     """
-    front_page_split = input_text.splitlines()
     front_page = front_page_split[:1] + front_page_split[5:]
 
     # join sentences
@@ -1,30 +1,107 @@
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+from io import BytesIO
+from itertools import chain
+import json
 import logging
+import math
 import pathlib
-import re
+import subprocess
 import tempfile
 from tqdm import tqdm
 
 import pandas as pd
 import pdfplumber
+from pdfplumber.utils import decimalize, extract_text
+from pdfminer.layout import LTChar, LTContainer
+from pdfminer.pdftypes import PDFException
+from pdfminer.psparser import PSException
 from PyPDF2 import PdfFileReader, PdfFileWriter
+from PyPDF2.utils import PdfReadError
 import tabula
+from tabula.io import _extract_from
 
 from musicie.exercise_1_ingest_structure_pdf_royalty_statements.base_pdf_formatter import (
     format_front_page,
+    get_table_signature,
+)
+from musicie.exercise_1_ingest_structure_pdf_royalty_statements.schema_classifier import (
+    FrontPageClassifier,
 )
 
 logging.basicConfig(level=logging.INFO)
 logging.getLogger("pdfminer").setLevel(logging.WARNING)
 _LOGGER = logging.getLogger(__file__)
 
+# documents shorter than this are never split across processes
+MIN_PAGES_PER_CHUNK = 50
+
+# number of pages extracted at a time when streaming page data
+STREAM_CHUNK_PAGES = 50
+
+# number of pages extracted in each pass, after which they are written to the page journal.
+# each pass starts a tabula-java process, which takes a few seconds, so smaller chunks lose
+# less work to a crash but slow down every extraction. passes are the same size without a
+# journal, so a failing page is found and skipped in the same way whether or not the cache is
+# used
+JOURNAL_CHUNK_PAGES = 250
+
+# bump whenever a change to the extraction alters the raw page data, invalidating the cache
+EXTRACTOR_VERSION = "2"
+
+# tables must be found on at least this many of the sample pages for a template to be learned
+MIN_TEMPLATE_PAGES = 2
+
+# points added around the learned table areas
+TEMPLATE_AREA_MARGIN = 1
+
+# the largest gap between the rows of a table extracted with a template, as a multiple of the
+# largest gap between rows on the sample pages. as template areas run to the bottom of the
+# page, a larger gap is taken to be other text below the table, such as a footer, and the
+# page is extracted with guessing instead
+TEMPLATE_ROW_GAP_TOLERANCE = 1.5
+
+# errors raised by tabula-java, pdfminer and PyPDF2 when they can't read particular pages.
+# a chunk of pages failing with one of these is split to find the pages at fault, and any
+# other error fails the whole document
+PAGE_EXTRACTION_ERRORS = (
+    subprocess.CalledProcessError,
+    json.JSONDecodeError,
+    PDFException,
+    PSException,
+    PdfReadError,
+)
+
 
 class BasePDFReader:
     """
     Class to read the correct data from the pdf specified by the pdf_path
     """
-    def __init__(self, pdf_path):
+    def __init__(
+        self,
+        pdf_path,
+        page_workers=1,
+        cache=None,
+        text_band=None,
+        table_templates=None,
+        template_sample_pages=0,
+        content_hash=None,
+    ):
         self._pdf_path = pdf_path
+        # the hash of the pdf's contents, if already computed, so the cache needn't hash it
+        self._content_hash = content_hash
+        self._page_workers = page_workers
+        self._cache = cache
+        self._text_band = text_band
+        self._table_templates = table_templates
+        self._template_sample_pages = template_sample_pages
+        # taken before any templates are learned, as the learned templates depend on the pdf
+        self._template_key = get_template_key(table_templates, template_sample_pages)
+        self._journal = None
+        # set once any page has been extracted, after which a page that fails on its own is
+        # taken to be at fault, rather than the document
+        self._pages_extracted = False
 
     def get_pdf_tables(self, multiple_tables=True, pages="all") -> list:
         """
@@ -34,21 +111,15 @@ class BasePDFReader:
             self._pdf_path, multiple_tables=multiple_tables, pages=pages
         )
 
-    def get_table_pages(self) -> dict:
+    def get_table_pages(self, all_tables=None, table_indices=None) -> dict:
         """
         Function to get the tables and the corresponding pages for those tables
         """
-        all_tables = self.get_pdf_tables()
-        all_table_schemas = [table.columns.tolist() for table in all_tables]
-        schema_dict = defaultdict(list)
-        for i, schema in enumerate(all_table_schemas):
-            schema_dict[tuple(schema)].append(i)
-        return {
-            schema: range(min(pages) + 1, max(pages) + 1)
-            if min(pages) != max(pages)
-            else min(pages)
-            for schema, pages in schema_dict.items()
-        }
+        if all_tables is None:
+            all_tables = self.get_pdf_tables()
+        return get_schema_pages(
+            [table.columns.tolist() for table in all_tables], table_indices
+        )
 
     def get_pdf_text(self, page: int) -> dict:
         """
@@ -58,26 +129,540 @@ class BasePDFReader:
             pdf_page = f.pages[page - 1]
             return {"page_no": page, "text": pdf_page.extract_text().splitlines()}
 
+    def split_pdf_pages(self, output_dir: pathlib.Path, page_numbers: list) -> dict:
+        """
+        Function to write each of the specified pages to its own single page pdf
+        """
+        page_paths = {}
+        with open(self._pdf_path, "rb") as pdf_file:
+            pdf = PdfFileReader(pdf_file)
+            for page_no in page_numbers:
+                pdf_file_writer = PdfFileWriter()
+                pdf_file_writer.addPage(pdf.getPage(page_no - 1))
+                page_paths[page_no] = output_dir / f"page_{page_no:06d}.pdf"
+                with open(page_paths[page_no], "wb") as page_file:
+                    pdf_file_writer.write(page_file)
+        return page_paths
+
+    def run_tabula_batch(self, page_numbers: list, **tabula_kwargs) -> dict:
+        """
+        Function to return tabula's json output for each of the specified pages, using a
+        single tabula-java run over a directory of single page pdfs
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            page_paths = self.split_pdf_pages(pathlib.Path(temp_dir), page_numbers)
+            tabula.convert_into_by_batch(
+                temp_dir,
+                output_format="json",
+                java_options=["-Dfile.encoding=UTF8"],
+                pages=1,
+                **tabula_kwargs,
+            )
+            page_json = {}
+            for page_no, page_path in page_paths.items():
+                with open(page_path.with_suffix(".json"), "r", encoding="utf-8") as f:
+                    page_json[page_no] = json.load(f)
+        return page_json
+
+    def learn_page_templates(self, page_numbers: list) -> dict:
+        """
+        Function to learn the table templates from the first template_sample_pages of the
+        specified pages, if no templates are declared or have been learned yet, returning
+        the tables found on the sample pages
+        """
+        if self._table_templates is not None or not self._template_sample_pages:
+            return {}
+        sample_pages = page_numbers[: self._template_sample_pages]
+        sample_json = self.run_tabula_batch(sample_pages)
+        with pdfplumber.open(self._pdf_path) as f:
+            page_height = float(f.pages[sample_pages[0] - 1].height)
+        self._table_templates = learn_table_templates(
+            list(sample_json.values()), page_height
+        )
+        _LOGGER.info(
+            f"learned {len(self._table_templates)} table templates from "
+            f"{len(sample_pages)} pages"
+        )
+        return {
+            page_no: _extract_from(tables) for page_no, tables in sample_json.items()
+        }
+
+    def get_batch_pdf_tables(self, page_numbers: list, page_templates=None) -> dict:
+        """
+        Function to return the tables on each of the specified pages. Each page is extracted
+        with the table template whose header was found on it, in page_templates, with
+        tabula's guessing turned off, so that each page is tried with at most one template.
+        Pages without a template, or failing its check, are extracted with guessing
+        """
+        page_templates = page_templates or {}
+        page_tables = {}
+        for template_index, template in enumerate(self._table_templates or []):
+            template_pages = [
+                page_no
+                for page_no in page_numbers
+                if page_templates.get(page_no) == template_index
+            ]
+            if not template_pages:
+                continue
+            template_json = self.run_tabula_batch(
+                template_pages,
+                guess=False,
+                stream=True,
+                area=template["area"],
+                columns=template["column_boundaries"],
+            )
+            for page_no, tables in template_json.items():
+                if check_template_tables(tables, template):
+                    page_tables[page_no] = _extract_from(tables)
+        remaining_pages = [
+            page_no for page_no in page_numbers if page_no not in page_tables
+        ]
+        if remaining_pages:
+            _LOGGER.info(f"extracting {len(remaining_pages)} pages with guessing")
+            page_tables.update(
+                {
+                    page_no: _extract_from(tables)
+                    for page_no, tables in self.run_tabula_batch(remaining_pages).items()
+                }
+            )
+        return page_tables
+
+    def get_batch_pdf_text(self, page_numbers: list) -> tuple:
+        """
+        Function to extract the text from each of the specified pages, opening the pdf once,
+        along with the index of the table template whose header is on each page, if any.
+        If a text_band is set, only the text in that fraction of the page height, from the
+        top, is extracted
+        """
+        page_text = {}
+        page_templates = {}
+        with pdfplumber.open(self._pdf_path) as f:
+            for page_no in tqdm(page_numbers):
+                pdf_page = f.pages[page_no - 1]
+                if self._table_templates:
+                    page_templates[page_no] = find_page_template(
+                        pdf_page, self._table_templates
+                    )
+                page_text[page_no] = {
+                    "page_no": page_no,
+                    "text": (
+                        (
+                            pdf_page.extract_text()
+                            if self._text_band is None
+                            else extract_band_text(pdf_page, self._text_band)
+                        )
+                        or ""
+                    ).splitlines(),
+                }
+        return page_text, page_templates
+
+    def get_no_pages(self) -> int:
+        """
+        Function to return the number of pages in the pdf
+        """
+        with open(self._pdf_path, "rb") as pdf_file:
+            return PdfFileReader(pdf_file).getNumPages()
+
+    def extract_page_chunk(self, page_numbers: list) -> list:
+        """
+        Function to extract the tables and text for the specified pages in a single pass. If
+        the pass fails with one of the PAGE_EXTRACTION_ERRORS, the pages are split in half and
+        each half is extracted separately, so that a page that can't be extracted is recorded
+        as failed and skipped, without failing the pages around it. If a page fails on its own
+        before any page has been extracted, the failure isn't limited to particular pages, so
+        the error is raised, as is any other error
+        """
+        try:
+            page_tables = self.learn_page_templates(page_numbers)
+            page_text, page_templates = self.get_batch_pdf_text(page_numbers)
+            page_tables.update(
+                self.get_batch_pdf_tables(
+                    [page_no for page_no in page_numbers if page_no not in page_tables],
+                    page_templates,
+                )
+            )
+        except PAGE_EXTRACTION_ERRORS as error:
+            if len(page_numbers) == 1 and not self._pages_extracted:
+                _LOGGER.error(
+                    f"failed to extract page {page_numbers[0]} before any other page, "
+                    f"failing the document: {error!r}"
+                )
+                raise
+            if len(page_numbers) == 1:
+                _LOGGER.error(f"failed to extract page {page_numbers[0]}: {error!r}")
+                return [get_failed_page(page_numbers[0], error)]
+            middle = len(page_numbers) // 2
+            return self.extract_page_chunk(
+                page_numbers[:middle]
+            ) + self.extract_page_chunk(page_numbers[middle:])
+        self._pages_extracted = True
+        return [
+            {
+                "page_number": page_no,
+                "page_tables": page_tables[page_no],
+                "page_text": page_text[page_no],
+            }
+            for page_no in page_numbers
+        ]
+
+    def extract_pages(self, page_numbers: list) -> list:
+        """
+        Function to extract the tables and text for the specified pages. If there is a page
+        journal, pages already in it are read from it rather than extracted. The rest are
+        extracted JOURNAL_CHUNK_PAGES at a time, each chunk being written to the journal, if
+        there is one, once extracted
+        """
+        extracted_pages = (
+            self._journal.get_pages(page_numbers) if self._journal is not None else {}
+        )
+        self._pages_extracted |= any(
+            "page_error" not in page for page in extracted_pages.values()
+        )
+        missing_pages = [
+            page_no for page_no in page_numbers if page_no not in extracted_pages
+        ]
+        if len(missing_pages) < len(page_numbers):
+            _LOGGER.info(
+                f"resuming extraction, {len(page_numbers) - len(missing_pages)} pages "
+                "read from the page journal"
+            )
+        for start in range(0, len(missing_pages), JOURNAL_CHUNK_PAGES):
+            chunk_page_data = self.extract_page_chunk(
+                missing_pages[start : start + JOURNAL_CHUNK_PAGES]
+            )
+            if self._journal is not None:
+                self._journal.put_pages(chunk_page_data)
+            extracted_pages.update({page["page_number"]: page for page in chunk_page_data})
+        return [extracted_pages[page_no] for page_no in page_numbers]
+
+    def get_page_chunks(self, no_pages: int) -> list:
+        """
+        Function to split the page range of the document into one chunk per page worker
+        """
+        chunk_size = max(math.ceil(no_pages / self._page_workers), MIN_PAGES_PER_CHUNK)
+        return [
+            list(range(start, min(start + chunk_size, no_pages + 1)))
+            for start in range(1, no_pages + 1, chunk_size)
+        ]
+
+    def extract_pages_in_parallel(self, page_chunks: list) -> list:
+        """
+        Function to extract each chunk of pages on a separate process, merging the results
+        back into page order
+        """
+        _LOGGER.info(
+            f"extracting {len(page_chunks)} page chunks across {self._page_workers} workers"
+        )
+        with ProcessPoolExecutor(max_workers=self._page_workers) as executor:
+            return list(
+                chain.from_iterable(executor.map(self.extract_pages, page_chunks))
+            )
+
+    def extract_page_data(self) -> tuple:
+        """
+        Function to extract the page data and number of pages from the pdf
+        """
+        no_pages = self.get_no_pages()
+        page_chunks = self.get_page_chunks(no_pages)
+        if len(page_chunks) > 1:
+            return self.extract_pages_in_parallel(page_chunks), no_pages
+        return self.extract_pages(list(range(1, no_pages + 1))), no_pages
+
+    def get_cache_key(self) -> str:
+        """
+        Function to get the cache key of the pdf's page data, which depends on the text band
+        and on the table templates, or the number of pages they are learned from
+        """
+        cache_key = self._cache.get_key(self._pdf_path, self._content_hash)
+        if self._text_band is not None:
+            cache_key += f"_band{self._text_band}"
+        return cache_key + self._template_key
+
     def get_page_data(self) -> tuple:
         """
         Function to get all data corresponding to each page of the input document
         """
         _LOGGER.info('obtaining pdf page data')
-        pdf = PdfFileReader(open(self._pdf_path, "rb"))
-        no_pages = pdf.getNumPages()
+        if self._cache is not None:
+            cache_key = self.get_cache_key()
+            cached_page_data = self._cache.get(cache_key)
+            if cached_page_data is None:
+                self._journal = self._cache.get_journal(cache_key)
+                cached_page_data = self.extract_page_data()
+                # the journal is kept while any pages have failed, so that a rerun only
+                # retries the failed pages
+                if not log_failed_pages(cached_page_data[0]):
+                    self._cache.put(cache_key, cached_page_data)
+                    self._journal.clear()
+            page_data, no_pages = cached_page_data
+        else:
+            page_data, no_pages = self.extract_page_data()
+            log_failed_pages(page_data)
+        # tables are indexed by page, so that a failed page doesn't shift the pages after it
+        page_tables = [
+            (page["page_number"] - 1, page_table)
+            for page in page_data
+            for page_table in page["page_tables"]
+        ]
         return (
-            [
-                {
-                    "page_number": page_no,
-                    "page_tables": self.get_pdf_tables(pages=page_no),
-                    "page_text": self.get_pdf_text(page=page_no),
-                }
-                for page_no in tqdm(range(1, no_pages + 1))
-            ],
-            self.get_table_pages(),
+            page_data,
+            self.get_table_pages(
+                [page_table for _, page_table in page_tables],
+                [table_index for table_index, _ in page_tables],
+            ),
             no_pages,
         )
 
+    def iter_page_data(self):
+        """
+        Function to yield the data for each page of the input document as it is extracted,
+        so that only a chunk of pages is held in memory at once
+        """
+        _LOGGER.info('streaming pdf page data')
+        if self._cache is not None:
+            cache_key = self.get_cache_key()
+            cached_page_data = self._cache.get(cache_key)
+            if cached_page_data is not None:
+                yield from cached_page_data[0]
+                return
+            self._journal = self._cache.get_journal(cache_key)
+        no_pages = self.get_no_pages()
+        failed_pages = []
+        for start in range(1, no_pages + 1, STREAM_CHUNK_PAGES):
+            page_data = self.extract_pages(
+                list(range(start, min(start + STREAM_CHUNK_PAGES, no_pages + 1)))
+            )
+            failed_pages += [page for page in page_data if "page_error" in page]
+            yield from page_data
+        if not log_failed_pages(failed_pages) and self._journal is not None:
+            self._journal.clear()
+
+
+def get_template_key(table_templates, template_sample_pages: int) -> str:
+    """
+    Function to return the part of the cache key set by the table templates. Declared
+    templates are keyed by a hash of their contents, and learned templates by the number of
+    sample pages they are learned from
+    """
+    if table_templates is not None:
+        templates_json = json.dumps(table_templates, sort_keys=True).encode("utf-8")
+        return f"_templates{hashlib.sha256(templates_json).hexdigest()[:16]}"
+    if template_sample_pages:
+        return f"_sample{template_sample_pages}"
+    return ""
+
+
+def get_schema_pages(all_table_schemas: list, table_indices=None) -> dict:
+    """
+    Function to map each table schema to the pages containing tables with that schema.
+    Tables are indexed by their position in all_table_schemas, unless table_indices are given
+    """
+    schema_dict = defaultdict(list)
+    if table_indices is None:
+        table_indices = range(len(all_table_schemas))
+    for i, schema in zip(table_indices, all_table_schemas):
+        schema_dict[tuple(schema)].append(i)
+    return {
+        schema: range(min(pages) + 1, max(pages) + 1)
+        if min(pages) != max(pages)
+        else min(pages)
+        for schema, pages in schema_dict.items()
+    }
+
+
+def check_template_tables(page_json: list, template: dict) -> bool:
+    """
+    Function to check tabula's json output for a page extracted with a template, which must
+    be a single table with the template's columns, and without any gap between its rows
+    larger than the template's max_row_gap
+    """
+    return (
+        len(page_json) == 1
+        and get_table_signature([cell["text"] for cell in page_json[0]["data"][0]])
+        == tuple(template["columns"])
+        and max(get_row_gaps(page_json[0]), default=0)
+        <= template.get("max_row_gap", math.inf)
+    )
+
+
+def get_row_gaps(table: dict) -> list:
+    """
+    Function to return the gaps between the tops of consecutive rows of a table in tabula's
+    json output, skipping empty rows
+    """
+    row_tops = [
+        min(cell["top"] for cell in row if cell["text"])
+        for row in table["data"]
+        if any(cell["text"] for cell in row)
+    ]
+    return [next_top - top for top, next_top in zip(row_tops, row_tops[1:])]
+
+
+def get_header_text(texts: list) -> str:
+    """
+    Function to join the text of a table header, ignoring whitespace, so that the header
+    found by tabula can be compared with the characters on a page
+    """
+    return "".join("".join(texts).split())
+
+
+def find_page_template(pdf_page: pdfplumber.page.Page, table_templates: list):
+    """
+    Function to return the index of the first table template whose header is on the page,
+    that is whose header text is made up of the characters centred in its header area. A
+    template without a header area matches every page. None is returned if no template
+    matches
+    """
+    page_height = float(pdf_page.height)
+    page_chars = sorted(
+        (
+            (page_height - (char.y0 + char.y1) / 2, char.x0, char.get_text())
+            for char in iter_layout_chars(pdf_page.layout)
+        ),
+        key=lambda page_char: page_char[1],
+    )
+    for template_index, template in enumerate(table_templates):
+        if "header_area" not in template:
+            return template_index
+        header_top, header_bottom = template["header_area"]
+        if template["header_text"] == get_header_text(
+            [
+                text
+                for centre, _, text in page_chars
+                if header_top <= centre <= header_bottom
+            ]
+        ):
+            return template_index
+    return None
+
+
+def learn_table_template(tables: list, page_height: float) -> dict:
+    """
+    Function to learn the area, header and column boundaries of a table layout from tabula's
+    json output for the same table on several pages. Each column boundary is placed midway
+    between the rightmost cell of a column and the leftmost cell of the next, and None is
+    returned if any columns overlap. The area runs to the bottom of the page, so that tables
+    longer than those on the sample pages aren't cut off
+    """
+    column_edges = [
+        [
+            (cell["left"], cell["left"] + cell["width"])
+            for table in tables
+            for row in table["data"]
+            for cell in row[i : i + 1]
+            if cell["text"]
+        ]
+        for i in range(len(tables[0]["data"][0]))
+    ]
+    column_boundaries = []
+    for column, next_column in zip(column_edges, column_edges[1:]):
+        right = max(edge[1] for edge in column)
+        left = min(edge[0] for edge in next_column)
+        if right >= left:
+            return None
+        column_boundaries.append(round((right + left) / 2, 1))
+    header_cells = [cell for table in tables for cell in table["data"][0] if cell["text"]]
+    return {
+        "columns": list(
+            get_table_signature([cell["text"] for cell in tables[0]["data"][0]])
+        ),
+        "header_text": get_header_text(
+            [cell["text"] for cell in tables[0]["data"][0]]
+        ),
+        "header_area": [
+            min(cell["top"] for cell in header_cells) - TEMPLATE_AREA_MARGIN,
+            max(cell["top"] + cell["height"] for cell in header_cells)
+            + TEMPLATE_AREA_MARGIN,
+        ],
+        "area": [
+            min(table["top"] for table in tables) - TEMPLATE_AREA_MARGIN,
+            0,
+            page_height,
+            max(table["right"] for table in tables) + TEMPLATE_AREA_MARGIN,
+        ],
+        "column_boundaries": column_boundaries,
+        "max_row_gap": max(max(get_row_gaps(table), default=0) for table in tables)
+        * TEMPLATE_ROW_GAP_TOLERANCE,
+    }
+
+
+def learn_table_templates(sample_json: list, page_height: float) -> list:
+    """
+    Function to learn a template for each table layout found on at least MIN_TEMPLATE_PAGES
+    of the sample pages, given tabula's json output for each page. Only pages holding a
+    single table found with stream extraction are used, and the templates are ordered by
+    how often their layout was found, as pages are matched to the first template whose
+    header they have
+    """
+    sample_tables = defaultdict(list)
+    for page_json in sample_json:
+        if len(page_json) == 1 and page_json[0]["extraction_method"] == "stream":
+            header = [cell["text"] for cell in page_json[0]["data"][0]]
+            sample_tables[get_table_signature(header)].append(page_json[0])
+    table_templates = [
+        learn_table_template(tables, page_height)
+        for tables in sorted(sample_tables.values(), key=len, reverse=True)
+        if len(tables) >= MIN_TEMPLATE_PAGES
+    ]
+    return [template for template in table_templates if template is not None]
+
+
+def get_failed_page(page_number: int, error: Exception) -> dict:
+    """
+    Function to return the page data recorded for a page that failed to extract, which has
+    no tables or text
+    """
+    return {
+        "page_number": page_number,
+        "page_tables": [],
+        "page_text": {"page_no": page_number, "text": []},
+        "page_error": repr(error),
+    }
+
+
+def log_failed_pages(page_data: list) -> list:
+    """
+    Function to log, and return, the numbers of the pages that failed to extract
+    """
+    failed_pages = [page["page_number"] for page in page_data if "page_error" in page]
+    if failed_pages:
+        _LOGGER.warning(
+            f"{len(failed_pages)} pages failed to extract and were skipped: {failed_pages}"
+        )
+    return failed_pages
+
+
+def iter_layout_chars(layout_objects):
+    """
+    Function to yield every character in a pdfminer layout, including those in figures
+    """
+    for layout_object in layout_objects:
+        if isinstance(layout_object, LTChar):
+            yield layout_object
+        elif isinstance(layout_object, LTContainer):
+            yield from iter_layout_chars(layout_object)
+
+
+def extract_band_text(pdf_page: pdfplumber.page.Page, text_band: float) -> str:
+    """
+    Function to extract the text from the top text_band fraction of a page. The characters
+    are read straight from the pdfminer layout, skipping the conversion of every object on
+    the page to a pdfplumber dictionary, and only those in the band are laid out into lines
+    """
+    page_height = float(pdf_page.height)
+    band_chars = [
+        {
+            "text": char.get_text(),
+            "x0": decimalize(char.x0),
+            "x1": decimalize(char.x1),
+            "doctop": decimalize(page_height - char.y1),
+            "upright": char.upright,
+        }
+        for char in iter_layout_chars(pdf_page.layout)
+        if page_height - char.y1 <= page_height * text_band
+    ]
+    return extract_text(band_chars)
+
 
 def extract_front_page_text(input_pdf: pd.DataFrame) -> str:
     """
@@ -90,27 +675,29 @@ def extract_front_page_text(input_pdf: pd.DataFrame) -> str:
         else input_pdf.rotateClockwise(360 + input_pdf.get("/Rotate"))
     )
     pdf_file_writer.addPage(pdf_front_page)
-    temp_file = tempfile.TemporaryFile()
-    pdf_file_writer.write(temp_file)
-    with pdfplumber.open(temp_file) as f:
-        return f.pages[0].extract_text()
+    front_page_buffer = BytesIO()
+    pdf_file_writer.write(front_page_buffer)
+    front_page_buffer.seek(0)
+    with pdfplumber.open(front_page_buffer) as f:
+        return f.pages[0].extract_text() or ""
 
 
 def determine_document_schema_type(input_pdf_path: pathlib.Path) -> tuple:
     """
     Function to return the correct schema type of the document, as well as the front page data
     """
-    front_page_text = extract_front_page_text(
-        PdfFileReader(open(input_pdf_path, "rb")).getPage(0)
-    )
-    potential_structures = [
-        structure_name
-        for regex, structure_name in pdf_structure_regex_dict.items()
-        if re.match(re.compile(regex, re.DOTALL), front_page_text)
-    ]
+    with open(input_pdf_path, "rb") as pdf_file:
+        front_page_text = extract_front_page_text(PdfFileReader(pdf_file).getPage(0))
+    potential_structures = FRONT_PAGE_CLASSIFIER.classify(front_page_text)
     assert len(potential_structures) == 1, 'narrow down regexes as picking up more than one schema'
-    front_page_data = format_front_page(potential_structures[0], front_page_text)
+    front_page_data = format_front_page(
+        potential_structures[0], front_page_text.splitlines()
+    )
     return potential_structures[0], front_page_data
 
 
-pdf_structure_regex_dict = {r".*WC Music Corp\..*": "wc_music_corp"}
+pdf_structure_dict = {
+    "wc_music_corp": {"anchor_token": "WC", "regex": r"WC Music Corp\."},
+}
+
+FRONT_PAGE_CLASSIFIER = FrontPageClassifier(pdf_structure_dict)
@@ -1,18 +1,41 @@
 import codecs
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from itertools import chain
+import json
+import logging
+import os
 from pathlib import Path
 import pathlib
+import shutil
 
 from jinja2 import Template
+import numpy as np
 import pandas as pd
 import pdfkit
 
+from musicie.instrumentation import span
+
+logging.basicConfig(level=logging.INFO)
+_LOGGER = logging.getLogger(__file__)
+
 with codecs.open(Path(__file__).parent / "testing_template.html") as f:
     template_code = f.read()
 
 TEMPLATE = Template(template_code)
 
+CSS_FILES = [
+    Path(__file__).parent / "static" / "bootstrap-4.1.3-dist" / "css" / "bootstrap.css",
+]
+
+# failure calculations longer than this are truncated in the report
+MAX_FAILURE_ROWS = 50
+
+# pdf: render each report straight to pdf
+# html: write each report as html only
+# deferred_pdf: write each report as html, and convert them all to pdf at the end of the run
+REPORT_MODES = ["pdf", "html", "deferred_pdf"]
+
 class BasePDFValidator:
     """
     Class to validate input pdf
@@ -25,6 +48,8 @@ class BasePDFValidator:
         page_table_numbers: dict,
         front_page_data: dict,
         no_pages: int,
+        report_mode="pdf",
+        report_json=False,
     ):
         self._config = config
         self._output_folder = output_folder
@@ -34,17 +59,17 @@ class BasePDFValidator:
         self._front_page_data = front_page_data
         self._no_pages = no_pages
         self._template = TEMPLATE
-        self._css_files = [
-            Path(__file__).parent
-            / "static"
-            / "bootstrap-4.1.3-dist"
-            / "css"
-            / "bootstrap.css",
-        ]
+        self._css_files = CSS_FILES
+        self._report_mode = report_mode
+        self._report_json = report_json
 
-    def write_validation_data(self, input_validation_data: dict, test_definitions: dict) -> None:
+    def write_validation_data(
+        self, input_validation_data: dict, test_definitions: dict
+    ) -> pathlib.Path:
         """
-        Function to write the validation data to an output pdf as specified in the config
+        Function to write the validation data to an output report as specified in the config.
+        Depending on the report mode the report is written as pdf, or as html to be converted
+        to pdf later. Returns the path of the report written
         """
         document_result = all(
             x["Result"] == "Pass"
@@ -98,15 +123,59 @@ class BasePDFValidator:
             "document_id": self._front_page_data["unique_id"],
             "date_generated": datetime.today().date().strftime("%d/%m/%Y"),
         }
-        html_out = self._template.render(template_vars)
-        pdfkit.from_string(
-            html_out,
-            self._output_folder / self._config["report_output_name"],
-            configuration=pdfkit.configuration(
-                wkhtmltopdf=r"C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe"
-            ),
-            css=self._css_files,
-        )
+        report_path = self._output_folder / self._config["report_output_name"]
+        self._output_folder.mkdir(parents=True, exist_ok=True)
+        with span("pdf.report_rendering", report_mode=self._report_mode) as current_span:
+            if self._report_json:
+                self.write_validation_json(
+                    input_validation_data, report_path.with_suffix(".json")
+                )
+            if self._report_mode == "pdf":
+                pdfkit.from_string(
+                    self._template.render(template_vars),
+                    report_path,
+                    configuration=get_pdfkit_configuration(),
+                    css=self._css_files,
+                )
+            else:
+                # the css is injected by pdfkit when converting, so is only linked for html
+                # reports
+                html_out = self._template.render(
+                    {
+                        **template_vars,
+                        "stylesheets": [
+                            css_file.as_uri() for css_file in self._css_files
+                        ]
+                        if self._report_mode == "html"
+                        else [],
+                    }
+                )
+                report_path = report_path.with_suffix(".html")
+                with open(report_path, "w", encoding="utf-8") as f:
+                    f.write(html_out)
+            current_span.add(bytes=report_path.stat().st_size)
+        return report_path
+
+    @staticmethod
+    def write_validation_json(input_validation_data: dict, output_path: pathlib.Path) -> None:
+        """
+        Function to write the full validation data, including every calculation, to json
+        """
+        json_validation_data = {
+            results_type: [
+                [
+                    {
+                        k: v.to_dict(orient="records") if isinstance(v, pd.DataFrame) else v
+                        for k, v in result.items()
+                    }
+                    for result in results
+                ]
+                for results in results_list
+            ]
+            for results_type, results_list in input_validation_data.items()
+        }
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(json_validation_data, f, default=str, indent=2)
 
     @staticmethod
     def format_whole_document_html(input_table: list) -> str:
@@ -138,7 +207,7 @@ class BasePDFValidator:
     @staticmethod
     def format_failure_dfs(input_failure_dfs: list) -> str:
         """
-        Function to format the failure dataframes into html
+        Function to format the failure dataframes into html, truncating any long calculations
         """
         if not input_failure_dfs:
             return ""
@@ -149,12 +218,14 @@ class BasePDFValidator:
         failure_html_string = "".join(
             [
                 f"""<li><p><b>Table Name</b>: {table['table_name']}<p><b>Test Type</b>:
-                {table['test_type']}<p><b>Test Calculation</b>: {table['calculation'].to_html(
+                {table['test_type']}<p><b>Test Calculation</b>: {table['calculation'].head(
+            MAX_FAILURE_ROWS
+        ).to_html(
             index=False,
             col_space=50,
             justify='left',
             classes=['table']
-        ).replace('border="1"','border="0"')}</li>"""
+        ).replace('border="1"','border="0"')}{format_truncation_note(table['calculation'])}</li>"""
                 for table in formatted_input_failure_dfs
             ]
         )
@@ -220,3 +291,64 @@ class BasePDFValidator:
         Function to validate the data. Must be overridden
         """
         raise NotImplementedError
+
+
+def isclose_array(a, b, rel_tol=1e-09, abs_tol=0.0) -> np.ndarray:
+    """
+    Function to compare two arrays elementwise with the same semantics as math.isclose
+    """
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    return (a == b) | (
+        np.abs(a - b) <= np.maximum(rel_tol * np.maximum(np.abs(a), np.abs(b)), abs_tol)
+    )
+
+
+def format_truncation_note(input_calculation: pd.DataFrame) -> str:
+    """
+    Function to note how many rows of a failure calculation have been left out of the report
+    """
+    if len(input_calculation) <= MAX_FAILURE_ROWS:
+        return ""
+    return (
+        f"<p><i>Showing the first {MAX_FAILURE_ROWS} of {len(input_calculation)} rows, "
+        "write the report as json to see every row</i></p>"
+    )
+
+
+def get_pdfkit_configuration() -> pdfkit.configuration:
+    """
+    Function to locate wkhtmltopdf, either from the WKHTMLTOPDF_PATH environment variable,
+    the PATH, or the default windows install location
+    """
+    return pdfkit.configuration(
+        wkhtmltopdf=os.environ.get("WKHTMLTOPDF_PATH")
+        or shutil.which("wkhtmltopdf")
+        or r"C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe"
+    )
+
+
+def convert_html_report_to_pdf(html_report_path: pathlib.Path) -> pathlib.Path:
+    """
+    Function to convert a html quality report to pdf alongside it
+    """
+    pdf_report_path = html_report_path.with_suffix(".pdf")
+    pdfkit.from_file(
+        str(html_report_path),
+        str(pdf_report_path),
+        configuration=get_pdfkit_configuration(),
+        css=CSS_FILES,
+    )
+    return pdf_report_path
+
+
+def convert_html_reports_to_pdf(html_report_paths: list, workers=4) -> list:
+    """
+    Function to convert a list of html quality reports to pdf, running one wkhtmltopdf
+    process per report, workers at a time. The reports aren't passed to a single
+    wkhtmltopdf call, as it joins all of its inputs into one pdf
+    """
+    _LOGGER.info(f"converting {len(html_report_paths)} quality reports to pdf")
+    with span("pdf.report_conversion", reports=len(html_report_paths)):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(convert_html_report_to_pdf, html_report_paths))
@@ -0,0 +1,161 @@
+import hashlib
+import logging
+import os
+from pathlib import Path
+import pathlib
+import pickle
+import shutil
+import tempfile
+
+logging.basicConfig(level=logging.INFO)
+_LOGGER = logging.getLogger(__file__)
+
+DEFAULT_CACHE_FOLDER = Path.home() / ".cache" / "musicie" / "extraction"
+DEFAULT_MAX_CACHE_BYTES = 2 * 1024**3
+
+
+def get_file_hash(file_path: pathlib.Path) -> str:
+    """
+    Function to return the sha256 of the contents of a file
+    """
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+class ExtractionCache:
+    """
+    Class to cache the raw page data extracted from a pdf on disk, keyed by the pdf hash
+    """
+    def __init__(
+        self,
+        extractor_version: str,
+        cache_folder: pathlib.Path = DEFAULT_CACHE_FOLDER,
+        max_bytes: int = DEFAULT_MAX_CACHE_BYTES,
+    ):
+        self._extractor_version = extractor_version
+        self._cache_folder = Path(cache_folder)
+        self._max_bytes = max_bytes
+        self._cache_folder.mkdir(parents=True, exist_ok=True)
+
+    def get_key(self, pdf_path: pathlib.Path, file_hash=None) -> str:
+        """
+        Function to create the cache key for the pdf specified by the pdf_path, from its
+        file_hash if it has already been computed
+        """
+        if file_hash is None:
+            file_hash = get_file_hash(pdf_path)
+        return f"{file_hash}_{self._extractor_version}"
+
+    def get_path(self, key: str) -> pathlib.Path:
+        """
+        Function to return the location of the cache entry for the key
+        """
+        return self._cache_folder / (key + ".pkl")
+
+    def get_journal(self, key: str):
+        """
+        Function to return the page journal of the extraction for the key, which is kept
+        alongside the cache entry until the extraction completes
+        """
+        return PageJournal(self._cache_folder / (key + ".journal"))
+
+    def get(self, key: str):
+        """
+        Function to return the cached page data for the key, or None if it isn't cached
+        """
+        cache_path = self.get_path(key)
+        try:
+            with open(cache_path, "rb") as f:
+                page_data = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        # mark the entry as recently used
+        os.utime(cache_path)
+        _LOGGER.info(f"using cached page data {cache_path.name}")
+        return page_data
+
+    def put(self, key: str, page_data) -> None:
+        """
+        Function to write the page data to the cache and evict any old entries
+        """
+        with tempfile.NamedTemporaryFile(
+            dir=self._cache_folder, suffix=".tmp", delete=False
+        ) as f:
+            pickle.dump(page_data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f.name, self.get_path(key))
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Function to remove the least recently used entries until the cache fits in max_bytes
+        """
+        entries = []
+        for cache_path in self._cache_folder.glob("*.pkl"):
+            try:
+                stat = cache_path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, cache_path))
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, cache_path in sorted(entries):
+            if total_bytes <= self._max_bytes:
+                break
+            _LOGGER.info(f"evicting cached page data {cache_path.name}")
+            try:
+                cache_path.unlink()
+            except FileNotFoundError:
+                continue
+            total_bytes -= size
+
+
+class PageJournal:
+    """
+    Class to journal the page data of an extraction on disk as each page is extracted, one
+    file per page, so that an extraction that is stopped part way through can be resumed.
+    Pages that failed to extract are journalled with their error, and are retried on resume
+    """
+    def __init__(self, journal_folder: pathlib.Path):
+        self._journal_folder = Path(journal_folder)
+
+    def get_path(self, page_number: int) -> pathlib.Path:
+        """
+        Function to return the location of the journal entry for the page
+        """
+        return self._journal_folder / f"page_{page_number:06d}.pkl"
+
+    def put_pages(self, page_data: list) -> None:
+        """
+        Function to write the data of each page to the journal
+        """
+        self._journal_folder.mkdir(parents=True, exist_ok=True)
+        for page in page_data:
+            with tempfile.NamedTemporaryFile(
+                dir=self._journal_folder, suffix=".tmp", delete=False
+            ) as f:
+                pickle.dump(page, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f.name, self.get_path(page["page_number"]))
+
+    def get_pages(self, page_numbers: list) -> dict:
+        """
+        Function to return the data of each of the specified pages that has been extracted,
+        keyed by page number. Failed pages, and any entry that can't be read, are left out
+        """
+        page_data = {}
+        for page_number in page_numbers:
+            try:
+                with open(self.get_path(page_number), "rb") as f:
+                    page = pickle.load(f)
+            except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+                continue
+            if "page_error" not in page:
+                page_data[page_number] = page
+        return page_data
+
+    def clear(self) -> None:
+        """
+        Function to remove the journal, once its extraction has completed
+        """
+        shutil.rmtree(self._journal_folder, ignore_errors=True)
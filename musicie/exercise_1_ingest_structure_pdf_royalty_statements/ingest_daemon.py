@@ -0,0 +1,353 @@
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+import logging
+from pathlib import Path
+import pathlib
+import sqlite3
+import time
+
+from musicie.exercise_1_ingest_structure_pdf_royalty_statements.extraction_cache import (
+    get_file_hash,
+)
+from musicie.exercise_1_ingest_structure_pdf_royalty_statements.task_1 import (
+    get_input_pdf_files,
+    get_loaded_content_hashes,
+    process_pdf_job,
+    write_pdf_job,
+)
+
+logging.basicConfig(level=logging.INFO)
+_LOGGER = logging.getLogger(__file__)
+
+JOB_STATUSES = ["pending", "running", "done", "failed"]
+
+SQL_NEEDS_INCREMENTAL = (
+    "the ingest daemon only writes to sql in incremental mode, which upserts each pdf "
+    "rather than truncating the tables"
+)
+
+
+class JobQueue:
+    """
+    Class to hold the pdfs waiting to be ingested in a sqlite database, so that queued
+    jobs survive the daemon restarting. Jobs are keyed by the path, modified time and size
+    of their pdf, so a pdf replaced under the same name is queued again
+    """
+    def __init__(self, db_path: pathlib.Path):
+        self._db_path = Path(db_path)
+        self._db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(self._db_path, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self.transaction():
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id INTEGER PRIMARY KEY,
+                    pdf_path TEXT NOT NULL,
+                    modified_at REAL NOT NULL,
+                    size INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    enqueued_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    unique_id TEXT,
+                    error TEXT,
+                    UNIQUE (pdf_path, modified_at, size)
+                )
+                """
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, next_attempt_at)"
+            )
+
+    @contextmanager
+    def transaction(self):
+        """
+        Function to run a block in a transaction that takes the write lock as it begins, so
+        that another daemon can't change a job between it being read and updated. The
+        connection is in autocommit mode, so a transaction has to be begun explicitly
+        """
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._connection
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    def close(self) -> None:
+        """
+        Function to close the connection to the queue database
+        """
+        self._connection.close()
+
+    def enqueue(self, pdf_versions: list) -> int:
+        """
+        Function to add any (pdf path, modified time, size) versions of pdfs that haven't
+        been seen before to the queue, returning the number of jobs added
+        """
+        now = time.time()
+        with self.transaction():
+            cursor = self._connection.executemany(
+                """
+                INSERT OR IGNORE INTO jobs (pdf_path, modified_at, size, status,
+                    next_attempt_at, enqueued_at, updated_at)
+                VALUES (?, ?, ?, 'pending', ?, ?, ?)
+                """,
+                [
+                    (str(pdf_path), modified_at, size, now, now, now)
+                    for pdf_path, modified_at, size in pdf_versions
+                ],
+            )
+        return cursor.rowcount
+
+    def claim(self, n: int) -> list:
+        """
+        Function to mark up to n pending jobs that are due as running, returning their job
+        ids and pdf paths
+        """
+        now = time.time()
+        with self.transaction():
+            jobs = self._connection.execute(
+                """
+                SELECT job_id, pdf_path FROM jobs
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                ORDER BY enqueued_at, job_id
+                LIMIT ?
+                """,
+                (now, n),
+            ).fetchall()
+            self._connection.executemany(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? "
+                "WHERE job_id = ?",
+                [(now, job_id) for job_id, _ in jobs],
+            )
+        return [(job_id, Path(pdf_path)) for job_id, pdf_path in jobs]
+
+    def complete(self, job_id: int, unique_id: str) -> None:
+        """
+        Function to mark a job as done
+        """
+        with self.transaction():
+            self._connection.execute(
+                "UPDATE jobs SET status = 'done', unique_id = ?, error = NULL, updated_at = ? "
+                "WHERE job_id = ?",
+                (unique_id, time.time(), job_id),
+            )
+
+    def fail(
+        self, job_id: int, error: str, max_attempts: int, retry_delay: float
+    ) -> str:
+        """
+        Function to put a failed job back in the queue with an exponential backoff, or mark it
+        as failed once it has used all of its attempts. Returns the new status of the job
+        """
+        now = time.time()
+        with self.transaction():
+            (attempts,) = self._connection.execute(
+                "SELECT attempts FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            status = "failed" if attempts >= max_attempts else "pending"
+            self._connection.execute(
+                "UPDATE jobs SET status = ?, error = ?, next_attempt_at = ?, updated_at = ? "
+                "WHERE job_id = ?",
+                (status, error, now + retry_delay * 2 ** (attempts - 1), now, job_id),
+            )
+        return status
+
+    def requeue_running(self) -> int:
+        """
+        Function to put any jobs left running by a previous daemon back in the queue
+        """
+        with self.transaction():
+            cursor = self._connection.execute(
+                "UPDATE jobs SET status = 'pending', updated_at = ? WHERE status = 'running'",
+                (time.time(),),
+            )
+        return cursor.rowcount
+
+    def get_queue_depth(self) -> dict:
+        """
+        Function to return the number of jobs in each status
+        """
+        counts = dict(
+            self._connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+        )
+        return {status: counts.get(status, 0) for status in JOB_STATUSES}
+
+    def get_failed_jobs(self) -> list:
+        """
+        Function to return the pdf path, attempts and last error of every failed job
+        """
+        return self._connection.execute(
+            "SELECT pdf_path, attempts, error FROM jobs WHERE status = 'failed' "
+            "ORDER BY pdf_path, job_id"
+        ).fetchall()
+
+
+def get_pdf_version(pdf_file: pathlib.Path) -> tuple:
+    """
+    Function to return the modified time and size of a pdf, which with its path identify
+    the version of the pdf queued. A pdf that no longer exists gets a version that no pdf
+    on disk can match
+    """
+    try:
+        pdf_stat = pdf_file.stat()
+    except FileNotFoundError:
+        return 0.0, -1
+    return pdf_stat.st_mtime, pdf_stat.st_size
+
+
+def get_settled_pdf_files(input_folder: pathlib.Path, settle_seconds: float) -> list:
+    """
+    Function to return the (path, modified time, size) of the pdfs in the input folder that
+    haven't been modified for settle_seconds, so that pdfs still being copied in aren't
+    picked up
+    """
+    now = time.time()
+    settled_pdf_files = []
+    for pdf_file in get_input_pdf_files(input_folder):
+        modified_at, size = get_pdf_version(pdf_file)
+        if size >= 0 and now - modified_at >= settle_seconds:
+            settled_pdf_files.append((pdf_file, modified_at, size))
+    return settled_pdf_files
+
+
+def run_job(
+    pdf_file: pathlib.Path,
+    output_folder: str,
+    write_mode=False,
+    database_config=None,
+    aws_config=None,
+    write_parquet=False,
+    incremental=False,
+    **process_kwargs,
+) -> str:
+    """
+    Function to read, format, validate and write a single pdf, returning its unique_id. In
+    incremental mode, a pdf already loaded into sql is skipped, returning None, and the rest
+    are upserted by their UniqueId
+    """
+    content_hash = get_file_hash(pdf_file) if incremental else None
+    if incremental and content_hash in get_loaded_content_hashes(database_config):
+        return None
+    return write_pdf_job(
+        process_pdf_job(
+            pdf_file, output_folder, content_hash=content_hash, **process_kwargs
+        ),
+        output_folder,
+        write_mode,
+        database_config=database_config,
+        aws_config=aws_config,
+        write_parquet=write_parquet,
+        incremental=incremental,
+    )
+
+
+def run_daemon(
+    input_folder: pathlib.Path,
+    output_folder: str,
+    queue_db: pathlib.Path,
+    write_mode=False,
+    database_config=None,
+    aws_config=None,
+    write_parquet=False,
+    incremental=False,
+    workers=1,
+    poll_interval=10.0,
+    settle_seconds=5.0,
+    max_attempts=3,
+    retry_delay=30.0,
+    once=False,
+    **process_kwargs,
+) -> dict:
+    """
+    Function to watch the input folder, queue any new pdfs, and ingest them across a pool of
+    worker processes. Failed jobs are retried with an exponential backoff up to max_attempts,
+    and the pool is restarted if a worker process dies. If once is set, the daemon stops once
+    the queue has been drained. Returns the final queue depth.
+    Writing to sql needs incremental mode, as the workers write at the same time, and would
+    otherwise each truncate the tables the others are loading
+    """
+    if write_mode and database_config is not None and not incremental:
+        raise ValueError(SQL_NEEDS_INCREMENTAL)
+    if incremental and not (write_mode and database_config is not None):
+        _LOGGER.warning("incremental mode needs write_mode and a postgres_yaml, ignoring")
+        incremental = False
+    job_queue = JobQueue(queue_db)
+    requeued = job_queue.requeue_running()
+    if requeued:
+        _LOGGER.info(f"requeued {requeued} jobs left running by a previous daemon")
+    job_args = (
+        output_folder,
+        write_mode,
+        database_config,
+        aws_config,
+        write_parquet,
+        incremental,
+    )
+    in_flight = {}
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            enqueued = job_queue.enqueue(
+                get_settled_pdf_files(input_folder, settle_seconds)
+            )
+            for job_id, pdf_file in job_queue.claim(workers - len(in_flight)):
+                try:
+                    future = executor.submit(
+                        run_job, pdf_file, *job_args, **process_kwargs
+                    )
+                except BrokenProcessPool:
+                    executor = restart_executor(executor, workers)
+                    future = executor.submit(
+                        run_job, pdf_file, *job_args, **process_kwargs
+                    )
+                in_flight[future] = job_id, pdf_file
+            queue_depth = job_queue.get_queue_depth()
+            _LOGGER.info(f"enqueued {enqueued} new pdfs, queue depth {queue_depth}")
+            if once and not in_flight and not queue_depth["pending"]:
+                return queue_depth
+            done, _ = wait(
+                list(in_flight), timeout=poll_interval, return_when=FIRST_COMPLETED
+            )
+            pool_broken = False
+            for future in done:
+                job_id, pdf_file = in_flight.pop(future)
+                try:
+                    unique_id = future.result()
+                except Exception as error: #pylint:disable=broad-except
+                    # a worker dying takes every job in flight with it, and each is
+                    # charged an attempt so that a pdf which crashes workers ends up failed
+                    pool_broken |= isinstance(error, BrokenProcessPool)
+                    status = job_queue.fail(
+                        job_id, repr(error), max_attempts, retry_delay
+                    )
+                    _LOGGER.error(f"failed to ingest {pdf_file} ({status}): {error!r}")
+                    continue
+                job_queue.complete(job_id, unique_id)
+                if unique_id is None:
+                    _LOGGER.info(f"skipped {pdf_file}, its contents are already loaded")
+                else:
+                    _LOGGER.info(f"ingested {pdf_file} as {unique_id}")
+            if pool_broken:
+                executor = restart_executor(executor, workers)
+            if not in_flight and not done:
+                # nothing running, so wait for the next poll rather than spinning
+                time.sleep(poll_interval)
+    finally:
+        executor.shutdown()
+        job_queue.close()
+
+
+def restart_executor(
+    executor: ProcessPoolExecutor, workers: int
+) -> ProcessPoolExecutor:
+    """
+    Function to replace a process pool that has been broken by a worker process dying
+    """
+    _LOGGER.warning("a worker process died, restarting the process pool")
+    executor.shutdown(wait=False)
+    return ProcessPoolExecutor(max_workers=workers)
@@ -0,0 +1,224 @@
+import logging
+from pathlib import Path
+import pathlib
+import sqlite3
+
+import pandas as pd
+
+from musicie.instrumentation import span
+
+logging.basicConfig(level=logging.INFO)
+_LOGGER = logging.getLogger(__file__)
+
+ROYALTY_STORE_NAME = "royalty_store.sqlite"
+
+# a table is given each of these indexes whose first column it has, on those of the
+# index's columns that it has, so that a statement's rows can be narrowed to a scope, and a
+# track's rows to a date range, without reading the rest
+STORE_INDEXES = [
+    ["statement_date", "scope"],
+    ["unique_id"],
+    ["scope"],
+    ["scope_name"],
+    ["territory_name"],
+    ["track_title", "statement_date"],
+]
+
+SQLITE_TYPES = {"i": "INTEGER", "u": "INTEGER", "f": "REAL", "b": "INTEGER"}
+
+# seconds to wait for another process (e.g. another daemon worker) to finish writing
+STORE_TIMEOUT = 60
+
+
+class RoyaltyStore:
+    """
+    Class to hold the tables of every ingested statement in a local sqlite database, indexed
+    so that they can be aggregated across statements without reloading the csv outputs
+    """
+
+    def __init__(self, db_path: pathlib.Path):
+        self._db_path = Path(db_path)
+        self._db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(self._db_path, timeout=STORE_TIMEOUT)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+
+    def close(self) -> None:
+        """
+        Function to close the connection to the store
+        """
+        self._connection.close()
+
+    def get_columns(self, table_name: str) -> list:
+        """
+        Function to return the columns of a table in the store, which is empty if the table
+        doesn't exist
+        """
+        return [
+            row[1]
+            for row in self._connection.execute(f'PRAGMA table_info("{table_name}")')
+        ]
+
+    def create_table(self, table_name: str, table_data: pd.DataFrame) -> None:
+        """
+        Function to create a table from the columns of a dataframe, along with its
+        STORE_INDEXES. If the table already exists, any of the dataframe's columns that it
+        doesn't have are added to it, so that a statement with an extra column can be
+        appended to the rows of earlier statements
+        """
+        table_columns = self.get_columns(table_name)
+        col_defs = [
+            f'"{col}" {SQLITE_TYPES.get(dtype.kind, "TEXT")}'
+            for col, dtype in table_data.dtypes.items()
+            if col not in table_columns
+        ]
+        if not table_columns:
+            self._connection.execute(
+                f'CREATE TABLE "{table_name}" ({", ".join(col_defs)})'
+            )
+        else:
+            for col_def in col_defs:
+                _LOGGER.info(f"adding column {col_def} to royalty store table {table_name}")
+                self._connection.execute(
+                    f'ALTER TABLE "{table_name}" ADD COLUMN {col_def}'
+                )
+        for index_cols in STORE_INDEXES:
+            if index_cols[0] not in table_data.columns:
+                continue
+            self._connection.execute(
+                f'CREATE INDEX IF NOT EXISTS "{table_name}_{index_cols[0]}" '
+                f'ON "{table_name}" ('
+                + ", ".join(
+                    f'"{col}"' for col in index_cols if col in table_data.columns
+                )
+                + ")"
+            )
+
+    def append_statement(
+        self, unique_id: str, statement_date, pdf_table_data: dict
+    ) -> None:
+        """
+        Function to add the tables of a statement to the store, tagged with its unique_id,
+        statement date and quarter. Any rows already stored for the statement are replaced,
+        in the same transaction, so that re-ingesting a statement doesn't duplicate it
+        """
+        statement_date = pd.Timestamp(statement_date) if statement_date else None
+        statement_cols = {
+            "unique_id": unique_id,
+            "statement_date": (
+                statement_date.strftime("%Y-%m-%d") if statement_date else None
+            ),
+            "statement_quarter": (
+                str(statement_date.to_period("Q")) if statement_date else None
+            ),
+        }
+        with span("sink.royalty_store", unique_id=unique_id) as current_span:
+            with self._connection:
+                for table_name, table_data in pdf_table_data.items():
+                    table_data = table_data.assign(**statement_cols)
+                    self.create_table(table_name, table_data)
+                    self._connection.execute(
+                        f'DELETE FROM "{table_name}" WHERE unique_id = ?', (unique_id,)
+                    )
+                    col_names = ", ".join(f'"{col}"' for col in table_data.columns)
+                    placeholders = ", ".join("?" for _ in table_data.columns)
+                    self._connection.executemany(
+                        f'INSERT INTO "{table_name}" ({col_names}) VALUES ({placeholders})',
+                        get_sqlite_rows(table_data),
+                    )
+                    current_span.add(rows=len(table_data))
+
+    def query(self, sql: str, params=()) -> pd.DataFrame:
+        """
+        Function to run a query against the store
+        """
+        with span("royalty_store.query"):
+            return pd.read_sql_query(sql, self._connection, params=params)
+
+    def aggregate(
+        self,
+        table_name: str,
+        measures: list,
+        group_by=(),
+        filters=None,
+        last_quarters=None,
+    ) -> pd.DataFrame:
+        """
+        Function to sum the measures of a table, grouped by the group_by columns, over the
+        rows matching every column value in filters. If last_quarters is set, only the
+        statements dated in the last_quarters quarters up to the latest statement are used
+        """
+        table_columns = self.get_columns(table_name)
+        filters = filters or {}
+        unknown_columns = (
+            set(measures).union(group_by, filters).difference(table_columns)
+        )
+        if unknown_columns:
+            raise KeyError(f"{table_name} has no columns {sorted(unknown_columns)}")
+        conditions = [f'"{col}" = ?' for col in filters]
+        params = list(filters.values())
+        if last_quarters:
+            conditions.append("statement_date >= ?")
+            params.append(self.get_quarters_start(table_name, last_quarters))
+        group_cols = ", ".join(f'"{col}"' for col in group_by)
+        # the unary + stops sqlite walking the index of a group_by column, such as scope,
+        # to avoid sorting, which reads every row rather than only those the filters match
+        index_free_group_cols = ", ".join(f'+"{col}"' for col in group_by)
+        sql = (
+            f"SELECT {group_cols + ', ' if group_by else ''}"
+            + ", ".join(f'SUM("{col}") AS "{col}"' for col in measures)
+            + f' FROM "{table_name}"'
+            + (f" WHERE {' AND '.join(conditions)}" if conditions else "")
+            + (
+                f" GROUP BY {index_free_group_cols} ORDER BY {group_cols}"
+                if group_by
+                else ""
+            )
+        )
+        return self.query(sql, params)
+
+    def get_quarters_start(self, table_name: str, n_quarters: int) -> str:
+        """
+        Function to return the first date of the n_quarters quarters up to, and including,
+        the quarter of the latest statement in the table
+        """
+        latest_date = self._connection.execute(
+            f'SELECT MAX(statement_date) FROM "{table_name}"'
+        ).fetchone()[0]
+        if latest_date is None:
+            return ""
+        first_quarter = pd.Timestamp(latest_date).to_period("Q") - (n_quarters - 1)
+        return first_quarter.start_time.strftime("%Y-%m-%d")
+
+
+def get_sqlite_rows(input_df: pd.DataFrame):
+    """
+    Function to yield the rows of a dataframe as tuples of python values that sqlite can
+    store, with datetimes as iso strings and missing values as None
+    """
+    datetime_cols = input_df.select_dtypes(include=["datetime", "datetimetz"]).columns
+    if len(datetime_cols):
+        input_df = input_df.assign(
+            **{
+                col: input_df[col].dt.strftime("%Y-%m-%d %H:%M:%S")
+                for col in datetime_cols
+            }
+        )
+    return (
+        input_df.astype(object)
+        .where(input_df.notna(), None)
+        .itertuples(index=False, name=None)
+    )
+
+
+def append_to_royalty_store(
+    output_folder: str, pdf_file_id: str, statement_date, pdf_table_data: dict
+) -> None:
+    """
+    Function to add the tables of a statement to the royalty store in the output folder
+    """
+    _LOGGER.info(f"appending {pdf_file_id} to the royalty store")
+    royalty_store = RoyaltyStore(Path(output_folder) / ROYALTY_STORE_NAME)
+    try:
+        royalty_store.append_statement(pdf_file_id, statement_date, pdf_table_data)
+    finally:
+        royalty_store.close()
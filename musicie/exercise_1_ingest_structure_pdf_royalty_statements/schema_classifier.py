@@ -0,0 +1,39 @@
+from collections import defaultdict
+from itertools import chain
+import re
+
+
+class FrontPageClassifier:
+    """
+    Class to classify the schema type of a pdf from the text on its front page.
+    Each schema is indexed by an anchor token, so only the schemas whose anchor token appears
+    on the front page have their regex run against it
+    """
+    def __init__(self, structure_dict: dict):
+        self._anchor_index = defaultdict(list)
+        for structure_name, structure in structure_dict.items():
+            self._anchor_index[structure["anchor_token"]].append(
+                (structure_name, re.compile(structure["regex"]))
+            )
+
+    def get_candidates(self, front_page_tokens: set) -> list:
+        """
+        Function to return the schemas whose anchor token is in the front page tokens
+        """
+        return list(
+            chain.from_iterable(
+                self._anchor_index[token]
+                for token in front_page_tokens
+                if token in self._anchor_index
+            )
+        )
+
+    def classify(self, front_page_text: str) -> list:
+        """
+        Function to return the names of all schemas matching the front page text
+        """
+        return sorted(
+            structure_name
+            for structure_name, regex in self.get_candidates(set(front_page_text.split()))
+            if regex.search(front_page_text)
+        )
@@ -0,0 +1,163 @@
+from functools import partial
+import logging
+import queue
+import threading
+
+logging.basicConfig(level=logging.INFO)
+_LOGGER = logging.getLogger(__file__)
+
+# put on a stage's input queue, once per worker, when there are no more items
+_STAGE_DONE = object()
+# passed on in place of the value of an item that failed, so ordered stages can skip it
+_DROPPED = object()
+
+
+class StagedPipeline:
+    """
+    Class to run items through a sequence of stages, each with its own pool of worker
+    threads, so that different items can be in different stages at once. The stages are
+    joined by bounded queues, so a stage that falls behind blocks the stages feeding it
+    rather than letting items pile up in memory. The items of an ordered stage are run in
+    the order they were fed in, rather than the order they reach the stage. Items are only
+    fed in while they are within the number of items the stages before each ordered stage
+    can hold of the next item it is waiting for, so the items it holds back are bounded too
+    """
+    def __init__(self, stages: list, queue_size=1, ordered_stages=()):
+        for stage_name, _, workers in stages:
+            if stage_name in ordered_stages and workers != 1:
+                raise ValueError(f"ordered stage {stage_name} must have a single worker")
+        self._stages = stages
+        self._ordered_stages = set(ordered_stages)
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in stages] + [queue.Queue()]
+        self._running_workers = [workers for _, _, workers in stages]
+        self._lock = threading.Lock()
+        # the index of the next item each ordered stage is waiting for, and the number of
+        # items, from that index, that can be fed in: those its queue and the queues and
+        # workers of the stages before it can hold
+        self._next_indexes = {
+            stage_index: 0
+            for stage_index, (stage_name, _, _) in enumerate(stages)
+            if stage_name in self._ordered_stages
+        }
+        self._feed_windows = {
+            stage_index: queue_size
+            + sum(workers + queue_size for _, _, workers in stages[:stage_index])
+            for stage_index in self._next_indexes
+        }
+        self._ordered_progress = threading.Condition()
+
+    def get_workers(self, stage_index: int) -> int:
+        """
+        Function to return the number of workers reading from the queue of the stage, where
+        the queue after the last stage is read by the thread running the pipeline
+        """
+        if stage_index == len(self._stages):
+            return 1
+        return self._stages[stage_index][2]
+
+    def can_feed(self, index: int) -> bool:
+        """
+        Function to return whether the item at index is within the feed window of every
+        ordered stage
+        """
+        return all(
+            index < next_index + self._feed_windows[stage_index]
+            for stage_index, next_index in self._next_indexes.items()
+        )
+
+    def feed(self, items: list) -> None:
+        """
+        Function to put the items on the queue of the first stage, blocking while it is full,
+        or while the next item is outside the feed window of an ordered stage
+        """
+        for index, (key, value) in enumerate(items):
+            with self._ordered_progress:
+                self._ordered_progress.wait_for(partial(self.can_feed, index))
+            self._queues[0].put((index, key, value))
+        for _ in range(self.get_workers(0)):
+            self._queues[0].put(_STAGE_DONE)
+
+    def close_stage(self, stage_index: int) -> None:
+        """
+        Function to mark a worker of the stage as finished. Once all of the stage's workers
+        have finished, the workers of the next stage are told there are no more items
+        """
+        with self._lock:
+            self._running_workers[stage_index] -= 1
+            if self._running_workers[stage_index]:
+                return
+        for _ in range(self.get_workers(stage_index + 1)):
+            self._queues[stage_index + 1].put(_STAGE_DONE)
+
+    def get_stage_items(self, stage_index: int):
+        """
+        Function to yield the items taken from the stage's queue until there are no more. An
+        ordered stage holds back the items that reach it early, until those fed in before
+        them have arrived, and lets the feed know each time it moves on to the next item
+        """
+        if self._stages[stage_index][0] not in self._ordered_stages:
+            yield from iter(self._queues[stage_index].get, _STAGE_DONE)
+            return
+        early_items = {}
+        next_index = 0
+        for item in iter(self._queues[stage_index].get, _STAGE_DONE):
+            early_items[item[0]] = item
+            del item
+            while next_index in early_items:
+                next_item = early_items.pop(next_index)
+                next_index += 1
+                with self._ordered_progress:
+                    self._next_indexes[stage_index] = next_index
+                    self._ordered_progress.notify_all()
+                yield next_item
+                del next_item
+
+    def run_stage(self, stage_index: int) -> None:
+        """
+        Function to run a worker of the stage, applying the stage's function to each
+        (index, key, value) item it takes from the stage's queue. An item whose function
+        raises is logged and dropped, so that it doesn't stop the remaining items
+        """
+        stage_name, stage_func, _ = self._stages[stage_index]
+        for index, key, value in self.get_stage_items(stage_index):
+            if value is _DROPPED:
+                self._queues[stage_index + 1].put((index, key, value))
+                continue
+            try:
+                output = stage_func(value)
+            except Exception as error: #pylint:disable=broad-except
+                _LOGGER.error(f"{stage_name} failed for {key}: {error!r}")
+                output = _DROPPED
+            # drop the reference to the input while blocked on a full queue
+            del value
+            self._queues[stage_index + 1].put((index, key, output))
+        self.close_stage(stage_index)
+
+    def run(self, items: list) -> list:
+        """
+        Function to run the items, a list of (key, value) pairs, through every stage,
+        returning the (key, value) pairs output by the last stage
+        """
+        threads = [threading.Thread(target=self.feed, args=(items,), daemon=True)]
+        for stage_index, (stage_name, _, workers) in enumerate(self._stages):
+            threads += [
+                threading.Thread(
+                    target=self.run_stage,
+                    args=(stage_index,),
+                    name=f"{stage_name}_{worker}",
+                    daemon=True,
+                )
+                for worker in range(workers)
+            ]
+        for thread in threads:
+            thread.start()
+        outputs = []
+        while True:
+            item = self._queues[-1].get()
+            if item is _STAGE_DONE:
+                break
+            if item[2] is not _DROPPED:
+                outputs.append(item[1:])
+        for thread in threads:
+            thread.join()
+        return outputs
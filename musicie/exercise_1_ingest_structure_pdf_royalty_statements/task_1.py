@@ -1,14 +1,46 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import logging
+import multiprocessing
 from pathlib import Path
 import pathlib
 import re
 
+import pandas as pd
+import sqlalchemy
 import yaml
 
+from musicie.exercise_1_ingest_structure_pdf_royalty_statements.base_pdf_formatter import (
+    ExpandedTables,
+    get_memory_usage,
+)
 from musicie.exercise_1_ingest_structure_pdf_royalty_statements.base_pdf_reader import (
     determine_document_schema_type,
+    EXTRACTOR_VERSION,
+)
+from musicie.exercise_1_ingest_structure_pdf_royalty_statements.base_pdf_validator import (
+    convert_html_reports_to_pdf,
+)
+from musicie.exercise_1_ingest_structure_pdf_royalty_statements.extraction_cache import (
+    ExtractionCache,
+    get_file_hash,
+)
+from musicie.exercise_1_ingest_structure_pdf_royalty_statements.royalty_store import (
+    append_to_royalty_store,
+)
+from musicie.exercise_1_ingest_structure_pdf_royalty_statements.staged_pipeline import (
+    StagedPipeline,
+)
+from musicie.instrumentation import span
+from musicie.utils import (
+    get_engine,
+    read_data_from_sql,
+    write_data_to_sql,
+    write_data_to_csv,
+    write_data_to_s3,
+    write_data_to_parquet,
+    write_dataframe_to_sql,
 )
-from musicie.utils import write_data_to_sql, write_data_to_csv, write_data_to_s3
 
 # logging
 logging.basicConfig(level=logging.INFO)
@@ -18,6 +50,9 @@ _LOGGER = logging.getLogger(__file__)
 with open(Path(__file__).parent / "config.yaml", 'r', encoding='utf-8') as file:
     CONFIG = yaml.load(file, Loader=yaml.FullLoader)
 
+# sql table recording the content hash of each statement loaded by an incremental run
+LOADED_STATEMENTS_TABLE = "LoadedStatements"
+
 
 def get_class(document_schema_type: str, class_type: str) -> type:
     """
@@ -48,7 +83,7 @@ def get_input_pdf_files(input_folder: str) -> list:
     Function to retrieve all pdf files in the input folder
     """
     input_folder = Path(input_folder)
-    return list(Path(input_folder).glob("*.pdf"))
+    return sorted(Path(input_folder).glob("*.pdf"))
 
 
 def format_table(input_table_data: list) -> list:
@@ -73,62 +108,464 @@ def format_tables_for_download(pdf_id: str, pdf_data: dict, file_in_name=False)
     }
 
 
+def count_rows(input_tables: dict) -> int:
+    """
+    Function to count the total rows across a dictionary of tables
+    """
+    return sum(len(table) for table in input_tables.values())
+
+
+def read_pdf_file(
+    pdf_file: pathlib.Path,
+    page_workers=1,
+    use_cache=True,
+    stream=False,
+    content_hash=None,
+) -> dict:
+    """
+    Function to determine the schema of a single pdf and extract its page data, returning
+    the pdf's job. The pdf is hashed unless its content_hash is passed in, and the hash is
+    reused for the extraction cache. In stream mode, pages are formatted as they are
+    extracted, so the job is formatted here too
+    """
+    if content_hash is None:
+        content_hash = get_file_hash(pdf_file)
+    pdf_bytes = Path(pdf_file).stat().st_size
+    with span("pdf.schema_detection", pdf=Path(pdf_file).name) as current_span:
+        document_schema_type, front_page_data = determine_document_schema_type(pdf_file)
+        current_span.add(bytes=pdf_bytes)
+    pdf_config = CONFIG[document_schema_type]
+    reader = get_class(document_schema_type, "reader")(
+        pdf_file,
+        page_workers=page_workers,
+        cache=ExtractionCache(EXTRACTOR_VERSION) if use_cache else None,
+        content_hash=content_hash,
+        **pdf_config.get("read_pdf_config", {}),
+    )
+    job = {
+        "pdf_file": pdf_file,
+        "content_hash": content_hash,
+        "document_schema_type": document_schema_type,
+        "front_page_data": front_page_data,
+    }
+    if stream:
+        formatter = get_class(document_schema_type, "formatter")(
+            pdf_config["format_pdf_config"]
+        )
+        # pages are extracted as they are formatted, so the two stages share a span
+        with span(
+            "pdf.extraction_and_formatting", pdf=Path(pdf_file).name
+        ) as current_span:
+            job["no_pages"] = reader.get_no_pages()
+            job["formatted_pdf_data"], job["formatted_page_table_numbers"] = (
+                formatter.format_pdf_data_stream(reader.iter_page_data())
+            )
+            current_span.add(
+                rows=count_rows(job["formatted_pdf_data"]), bytes=pdf_bytes
+            )
+    else:
+        with span("pdf.extraction", pdf=Path(pdf_file).name) as current_span:
+            job["page_data"], job["page_table_numbers"], job["no_pages"] = (
+                reader.get_page_data()
+            )
+            current_span.add(
+                rows=sum(
+                    len(page_table)
+                    for page in job["page_data"]
+                    for page_table in page["page_tables"]
+                ),
+                bytes=pdf_bytes,
+            )
+    return job
+
+
+def read_pdf_item(pdf_item: tuple, **read_kwargs) -> dict:
+    """
+    Function to read a pdf given as a (pdf file, content hash) pair, where the content hash
+    is None if the pdf hasn't been hashed yet
+    """
+    pdf_file, content_hash = pdf_item
+    return read_pdf_file(pdf_file, content_hash=content_hash, **read_kwargs)
+
+
+def format_pdf_job(job: dict) -> dict:
+    """
+    Function to format the page data of a pdf's job, unless it was formatted as it was read
+    """
+    if "formatted_pdf_data" in job:
+        return job
+    formatter = get_class(job["document_schema_type"], "formatter")(
+        CONFIG[job["document_schema_type"]]["format_pdf_config"]
+    )
+    with span("pdf.formatting", pdf=Path(job["pdf_file"]).name) as current_span:
+        job["formatted_pdf_data"], job["formatted_page_table_numbers"] = (
+            formatter.format_pdf_data(job["page_data"], job["page_table_numbers"])
+        )
+        current_span.add(rows=count_rows(job["formatted_pdf_data"]))
+    # the raw page tables aren't needed once formatted
+    del job["page_data"]
+    return job
+
+
+def validate_pdf_job(
+    job: dict, output_folder: str, report_mode="pdf", report_json=False
+) -> dict:
+    """
+    Function to validate the formatted data of a pdf's job, writing its quality report, and
+    then compact the data
+    """
+    pdf_config = CONFIG[job["document_schema_type"]]
+    with span("pdf.validation", pdf=Path(job["pdf_file"]).name) as current_span:
+        get_class(job["document_schema_type"], "validator")(
+            pdf_config["validate_pdf_config"],
+            Path(output_folder)
+            / Path(__file__).parent.name
+            / job["front_page_data"]["unique_id"],
+            job["formatted_pdf_data"],
+            job["formatted_page_table_numbers"],
+            job["front_page_data"],
+            job["no_pages"],
+            report_mode=report_mode,
+            report_json=report_json,
+        ).validate_data()
+        current_span.add(rows=count_rows(job["formatted_pdf_data"]))
+    # the tables are compacted once validated, as they are held in memory until written
+    formatter = get_class(job["document_schema_type"], "formatter")(
+        pdf_config["format_pdf_config"]
+    )
+    with span("pdf.compaction", pdf=Path(job["pdf_file"]).name) as current_span:
+        job["formatted_pdf_data"] = formatter.compact_pdf_data(job["formatted_pdf_data"])
+        current_span.add(
+            rows=count_rows(job["formatted_pdf_data"]),
+            bytes=get_memory_usage(job["formatted_pdf_data"]),
+        )
+    return job
+
+
+def process_pdf_job(
+    pdf_file: pathlib.Path,
+    output_folder: str,
+    page_workers=1,
+    use_cache=True,
+    stream=False,
+    report_mode="pdf",
+    report_json=False,
+    content_hash=None,
+) -> dict:
+    """
+    Function to read, format and validate a single pdf, returning its job
+    """
+    return validate_pdf_job(
+        format_pdf_job(
+            read_pdf_file(pdf_file, page_workers, use_cache, stream, content_hash)
+        ),
+        output_folder,
+        report_mode,
+        report_json,
+    )
+
+
+def process_pdf_file(
+    pdf_file: pathlib.Path, output_folder: str, **process_kwargs
+) -> tuple:
+    """
+    Function to read, format and validate a single pdf, returning its unique_id and data
+    """
+    job = process_pdf_job(pdf_file, output_folder, **process_kwargs)
+    return job["front_page_data"]["unique_id"], job["formatted_pdf_data"]
+
+
+def run_in_pool(executor: ProcessPoolExecutor, stage_func, *args, **kwargs):
+    """
+    Function to run a pipeline stage's function in a process of the executor, waiting for
+    its output
+    """
+    return executor.submit(stage_func, *args, **kwargs).result()
+
+
+def write_pdf_job(
+    job: dict, output_folder: str, write_mode=False, **write_kwargs
+) -> str:
+    """
+    Function to write the formatted data of a pdf's job if write_mode is set, returning
+    the pdf's unique_id so that the job's data can be released
+    """
+    if write_mode:
+        write_pdf_data(
+            job["front_page_data"]["unique_id"],
+            job["formatted_pdf_data"],
+            output_folder,
+            content_hash=job["content_hash"],
+            statement_date=job["front_page_data"]["date"],
+            parquet_schemas=get_class(job["document_schema_type"], "formatter")(
+                CONFIG[job["document_schema_type"]]["format_pdf_config"]
+            ).get_parquet_schemas(),
+            **write_kwargs,
+        )
+    return job["front_page_data"]["unique_id"]
+
+
+def get_loaded_content_hashes(database_config: str) -> set:
+    """
+    Function to return the content hashes of the statements already loaded into sql by
+    incremental runs
+    """
+    if not sqlalchemy.inspect(get_engine(database_config)).has_table(
+        LOADED_STATEMENTS_TABLE
+    ):
+        return set()
+    return set(
+        read_data_from_sql(
+            f'"{LOADED_STATEMENTS_TABLE}"', ['"ContentHash"'], database_config
+        )["ContentHash"]
+    )
+
+
+def get_pdf_files_to_load(input_pdf_files: list, database_config: str) -> dict:
+    """
+    Function to return the input pdfs whose contents haven't already been loaded into sql,
+    mapped to their content hashes, so that an incremental run only loads new or changed
+    statements
+    """
+    loaded_content_hashes = get_loaded_content_hashes(database_config)
+    pdf_files_to_load = {}
+    for pdf_file in input_pdf_files:
+        content_hash = get_file_hash(pdf_file)
+        if content_hash not in loaded_content_hashes:
+            pdf_files_to_load.setdefault(content_hash, pdf_file)
+    _LOGGER.info(
+        f"skipping {len(input_pdf_files) - len(pdf_files_to_load)} pdfs already loaded"
+    )
+    return {
+        pdf_file: content_hash for content_hash, pdf_file in pdf_files_to_load.items()
+    }
+
+
+def record_loaded_statement(
+    pdf_file_id: str, content_hash: str, database_config: str
+) -> None:
+    """
+    Function to record the content hash of a statement loaded into sql, once all of its
+    tables have been loaded
+    """
+    write_dataframe_to_sql(
+        pd.DataFrame({"UniqueId": [pdf_file_id], "ContentHash": [content_hash]}),
+        LOADED_STATEMENTS_TABLE,
+        if_exists="upsert",
+        postgres_yaml=database_config,
+        upsert_key="UniqueId",
+    )
+
+
+def get_stage_workers(workers=1, stage_workers=None) -> dict:
+    """
+    Function to return the number of workers of each pipeline stage. pdfs are read,
+    formatted and validated across workers processes, and written by a single thread,
+    unless set in stage_workers
+    """
+    return {
+        "read": workers,
+        "format": workers,
+        "validate": workers,
+        "write": 1,
+        **(stage_workers or {}),
+    }
+
+
+def get_stage_func(executor: ProcessPoolExecutor, stage_func, workers: int):
+    """
+    Function to return the function of a cpu bound pipeline stage, which is run in a
+    process of the executor if the stage has more than one worker
+    """
+    if workers > 1:
+        return partial(run_in_pool, executor, stage_func)
+    return stage_func
+
+
 def run_exercise(
     input_folder: pathlib.Path,
     output_folder: str,
     write_mode=False,
     database_config=None,
-    aws_config=None
+    aws_config=None,
+    workers=1,
+    page_workers=1,
+    use_cache=True,
+    stream=False,
+    report_mode="pdf",
+    report_json=False,
+    write_parquet=False,
+    stage_workers=None,
+    queue_size=1,
+    incremental=False,
 ) -> None:
     """
-    Function to run the code for the exercise
+    Function to run the code for the exercise. The pdfs are run through a staged pipeline,
+    so that one pdf is read while the previous one is formatted, validated and written,
+    with at most queue_size pdfs waiting between each pair of stages. When the sql tables
+    are truncated by each pdf, the pdfs are written in input order, so the last input pdf
+    is the one left in sql. In incremental mode, pdfs already loaded into sql are skipped,
+    and the rest are upserted by their UniqueId
     """
     exercise_number = re.search(r".*(\d+).*", Path(__file__).parent.name).group(1)
     _LOGGER.info(f"Running Exercise {exercise_number}")
     input_pdf_files = get_input_pdf_files(input_folder)
+    # the hashes of the pdfs hashed by an incremental run, so they aren't hashed again
+    content_hashes = {}
+    if incremental and write_mode and database_config is not None:
+        content_hashes = get_pdf_files_to_load(input_pdf_files, database_config)
+        input_pdf_files = list(content_hashes)
+    elif incremental:
+        _LOGGER.warning("incremental mode needs write_mode and a postgres_yaml, ignoring")
+        incremental = False
+    read_kwargs = {
+        "page_workers": page_workers,
+        "use_cache": use_cache,
+        "stream": stream,
+    }
+    stage_workers = get_stage_workers(workers, stage_workers)
+    ordered_stages = []
+    if write_mode and database_config is not None and not incremental:
+        # each pdf truncates the sql tables, so write in input order to make the pdf left
+        # in sql the same on every run
+        ordered_stages.append("write")
+        if stage_workers["write"] > 1:
+            _LOGGER.warning("pdfs are written in order when truncating sql, using 1 writer")
+            stage_workers["write"] = 1
+    _LOGGER.info(
+        f"processing {len(input_pdf_files)} pdfs with stage workers {stage_workers}"
+    )
 
-    formatted_data = {}
-    for pdf_file in input_pdf_files:
-        document_schema_type, front_page_data = determine_document_schema_type(pdf_file)
-        pdf_config = CONFIG[document_schema_type]
-        reader_cls = get_class(document_schema_type, "reader")
-        formatter_cls = get_class(document_schema_type, "formatter")
-        validator_cls = get_class(document_schema_type, "validator")
-        page_data, page_table_numbers, no_pages = reader_cls(pdf_file).get_page_data()
-        formatted_pdf_data, formatted_page_table_numbers = formatter_cls(
-            pdf_config["format_pdf_config"]
-        ).format_pdf_data(page_data, page_table_numbers)
-        validator_cls(
-            pdf_config["validate_pdf_config"],
-            Path(output_folder)
-            / Path(__file__).parent.name
-            / front_page_data["unique_id"],
-            formatted_pdf_data,
-            formatted_page_table_numbers,
-            front_page_data,
-            no_pages,
-        ).validate_data()
-        formatted_data[front_page_data["unique_id"]] = formatted_pdf_data
-
-    if write_mode:
-        # write data to csv
-        for pdf_file_id, pdf_table_data in formatted_data.items():
-            write_data_to_csv(
-                pdf_table_data,
-                Path(output_folder) / Path(__file__).parent.name / pdf_file_id,
-                index=False,
-                encoding='utf-8-sig'
+    # the pipeline's stage threads are running as worker processes start, so the processes
+    # are spawned rather than forked
+    with ProcessPoolExecutor(
+        max_workers=max(stage_workers[stage] for stage in ["read", "format", "validate"]),
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as executor:
+        pipeline = StagedPipeline(
+            [
+                (
+                    "read",
+                    partial(
+                        get_stage_func(executor, read_pdf_item, stage_workers["read"]),
+                        **read_kwargs,
+                    ),
+                    stage_workers["read"],
+                ),
+                (
+                    "format",
+                    get_stage_func(executor, format_pdf_job, stage_workers["format"]),
+                    stage_workers["format"],
+                ),
+                (
+                    "validate",
+                    partial(
+                        get_stage_func(
+                            executor, validate_pdf_job, stage_workers["validate"]
+                        ),
+                        output_folder=output_folder,
+                        report_mode=report_mode,
+                        report_json=report_json,
+                    ),
+                    stage_workers["validate"],
+                ),
+                (
+                    "write",
+                    partial(
+                        write_pdf_job,
+                        output_folder=output_folder,
+                        write_mode=write_mode,
+                        database_config=database_config,
+                        aws_config=aws_config,
+                        write_parquet=write_parquet,
+                        incremental=incremental,
+                    ),
+                    stage_workers["write"],
+                ),
+            ],
+            queue_size=queue_size,
+            ordered_stages=ordered_stages,
+        )
+        pdf_file_ids = [
+            pdf_file_id
+            for _, pdf_file_id in pipeline.run(
+                [
+                    (pdf_file, (pdf_file, content_hashes.get(pdf_file)))
+                    for pdf_file in input_pdf_files
+                ]
             )
-            if aws_config is not None:
-                write_data_to_s3(
-                    format_tables_for_download(pdf_file_id, pdf_table_data, file_in_name=True),
-                    index=False,
-                    encoding='utf-8-sig'
-                )
-            if database_config is not None:
-                # write data to sql
-                write_data_to_sql(
-                    format_tables_for_download(pdf_file_id, pdf_table_data),
-                    if_exists="replace",
-                    index=False,
-                )
+        ]
+
+    if report_mode == "deferred_pdf":
+        # convert all of the html quality reports written during the run, once the pdfs
+        # have been processed
+        convert_html_reports_to_pdf(
+            [
+                report_path
+                for pdf_file_id in pdf_file_ids
+                for report_path in (
+                    Path(output_folder) / Path(__file__).parent.name / pdf_file_id
+                ).glob("*.html")
+            ],
+            workers=workers,
+        )
+
+
+def write_pdf_data(
+    pdf_file_id: str,
+    pdf_table_data: dict,
+    output_folder: str,
+    database_config=None,
+    aws_config=None,
+    write_parquet=False,
+    incremental=False,
+    content_hash=None,
+    statement_date=None,
+    parquet_schemas=None,
+) -> None:
+    """
+    Function to write the formatted data of a single pdf to csv (and parquet if set, typed
+    from the parquet_schemas of its tables), and to s3 and sql if configured. The tables are also appended to the royalty store in the
+    output folder. In incremental mode, the pdf's rows are upserted into the sql tables by
+    UniqueId, and its content hash is recorded as loaded. The tables stay compacted, each
+    being expanded only as a sink writes it, and parquet and the royalty store keep the
+    categoricals and downcast integers, only having the money columns restored
+    """
+    # write data to csv
+    write_data_to_csv(
+        ExpandedTables(pdf_table_data),
+        Path(output_folder) / Path(__file__).parent.name / pdf_file_id,
+        index=False,
+        encoding='utf-8-sig'
+    )
+    if write_parquet:
+        write_data_to_parquet(
+            ExpandedTables(pdf_table_data, money_only=True),
+            Path(output_folder) / Path(__file__).parent.name / pdf_file_id,
+            table_schemas=parquet_schemas,
+        )
+    append_to_royalty_store(
+        output_folder,
+        pdf_file_id,
+        statement_date,
+        ExpandedTables(pdf_table_data, money_only=True),
+    )
+    if aws_config is not None:
+        write_data_to_s3(
+            format_tables_for_download(
+                pdf_file_id, ExpandedTables(pdf_table_data), file_in_name=True
+            ),
+            index=False,
+            encoding='utf-8-sig'
+        )
+    if database_config is not None:
+        # write data to sql
+        write_data_to_sql(
+            format_tables_for_download(pdf_file_id, ExpandedTables(pdf_table_data)),
+            if_exists="upsert" if incremental else "truncate",
+            index=False,
+            postgres_yaml=database_config,
+            upsert_key="UniqueId",
+        )
+        if incremental:
+            record_loaded_statement(pdf_file_id, content_hash, database_config)
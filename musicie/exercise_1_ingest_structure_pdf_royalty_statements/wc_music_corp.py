@@ -2,7 +2,7 @@ from collections import defaultdict
 import inspect
 from itertools import chain
 import logging
-import re
+import pathlib
 
 from math import isclose
 import numpy as np
@@ -11,14 +11,22 @@ import pandas as pd
 from musicie.exercise_1_ingest_structure_pdf_royalty_statements.base_pdf_formatter import (
     BasePDFFormatter,
 )
+from musicie.exercise_1_ingest_structure_pdf_royalty_statements.base_pdf_reader import (
+    get_schema_pages,
+)
 from musicie.exercise_1_ingest_structure_pdf_royalty_statements.base_pdf_validator import (
     BasePDFValidator,
+    isclose_array,
 )
 
 logging.basicConfig(level=logging.INFO)
 logging.getLogger("pdfminer").setLevel(logging.WARNING)
 _LOGGER = logging.getLogger(__file__)
 
+# raw tables read by the enhancements of later tables, which format_pdf_data_stream keeps
+# once formatted. Every other raw table is dropped as soon as it has been formatted
+STREAM_ENHANCEMENT_TABLES = ["scope_summary"]
+
 
 class WcMusicCorpValidator(BasePDFValidator):
     """
@@ -32,6 +40,8 @@ class WcMusicCorpValidator(BasePDFValidator):
         page_table_numbers,
         front_page_data,
         no_pages,
+        report_mode="pdf",
+        report_json=False,
     ):
         super().__init__(
             config,
@@ -40,6 +50,8 @@ class WcMusicCorpValidator(BasePDFValidator):
             page_table_numbers,
             front_page_data,
             no_pages,
+            report_mode,
+            report_json,
         )
 
         self._test_definitions = [
@@ -96,36 +108,31 @@ class WcMusicCorpValidator(BasePDFValidator):
         """
         Function to validate the gross payable sums as described in the scope_summary table
         """
-        scope_sum = self._pdf_data["scope_summary"][
-            ["scope_name", "gross_payable"]
-        ].to_dict(orient="records")
+        scope_sum = self._pdf_data["scope_summary"][["scope_name", "gross_payable"]]
+        scope_stated_sum = (
+            table_data.groupby("scope")["amount_paid"]
+            .sum()
+            .reindex(scope_sum["scope_name"], fill_value=0)
+            .to_numpy()
+        )
+        calculation = pd.DataFrame(
+            {
+                "table_name": table_name,
+                "scope_name": scope_sum["scope_name"].to_numpy(),
+                "scope_stated_sum": scope_stated_sum,
+                "scope_calculated_sum": scope_sum["gross_payable"].to_numpy(),
+            }
+        )
         return {
             "Table Name": table_name.title().replace("_", " "),
             "Test Type": "Scope Sum",
-            "Calculation": pd.DataFrame(
-                [
-                    {
-                        "table_name": table_name,
-                        "scope_name": item["scope_name"],
-                        "scope_stated_sum": table_data[
-                            table_data["scope"] == item["scope_name"]
-                        ]["amount_paid"].sum(),
-                        "scope_calculated_sum": item["gross_payable"],
-                    }
-                    for item in scope_sum
-                ]
-            ),
+            "Calculation": calculation,
             "Result": "Pass"
-            if all(
-                isclose(
-                    table_data[table_data["scope"] == item["scope_name"]][
-                        "amount_paid"
-                    ].sum(),
-                    item["gross_payable"],
-                    abs_tol=10,
-                )
-                for item in scope_sum
-            )
+            if isclose_array(
+                calculation["scope_stated_sum"],
+                calculation["scope_calculated_sum"],
+                abs_tol=10,
+            ).all()
             else "Fail",
         }
 
@@ -137,39 +144,36 @@ class WcMusicCorpValidator(BasePDFValidator):
         track_amount_received = table_data.groupby("track_title")[
             "amount_received"
         ].sum()
+        # the stated amount is repeated on every row of a track, so only unique amounts count
+        track_stated_amounts = (
+            table_data[["track_title", "track_amount_received"]]
+            .astype({"track_amount_received": "float"})
+            .drop_duplicates()
+            .groupby("track_title")["track_amount_received"]
+        )
+        track_stated_sum = track_stated_amounts.sum().where(
+            track_stated_amounts.count() == track_stated_amounts.size()
+        )
+        calculation = pd.DataFrame(
+            {
+                "table_name": table_name,
+                "track_name": track_amount_received.index.to_numpy(),
+                "track_stated_sum": track_stated_sum.reindex(
+                    track_amount_received.index
+                ).to_numpy(),
+                "track_calculated_sum": track_amount_received.to_numpy(),
+            }
+        )
         return {
             "Table Name": table_name.title().replace("_", " "),
             "Test Type": "Track Sum",
-            "Calculation": pd.DataFrame(
-                [
-                    {
-                        "table_name": table_name,
-                        "track_name": track_name,
-                        "track_stated_sum": table_data[
-                            table_data["track_title"] == track_name
-                        ]["track_amount_received"]
-                        .astype("float")
-                        .unique()
-                        .sum(),
-                        "track_calculated_sum": track_sum,
-                    }
-                    for track_name, track_sum in track_amount_received.items()
-                ]
-            ),
+            "Calculation": calculation,
             "Result": "Pass"
-            if all(
-                isclose(
-                    table_data[table_data["track_title"] == track_name][
-                        "track_amount_received"
-                    ]
-                    .astype("float")
-                    .unique()
-                    .sum(),
-                    track_sum,
-                    abs_tol=10,
-                )
-                for track_name, track_sum in track_amount_received.items()
-            )
+            if isclose_array(
+                calculation["track_stated_sum"],
+                calculation["track_calculated_sum"],
+                abs_tol=10,
+            ).all()
             else "Fail",
         }
 
@@ -197,7 +201,7 @@ class WcMusicCorpValidator(BasePDFValidator):
             for func_name, func in table_funcs.items()
         ]
 
-    def validate_data(self) -> None:
+    def validate_data(self) -> pathlib.Path:
         _LOGGER.info('validating data')
         tests_result = defaultdict(list)
         for table_name, table in self._pdf_data.items():
@@ -208,7 +212,7 @@ class WcMusicCorpValidator(BasePDFValidator):
             tests_result["table_results"].append(table_results)
         document_results = [self.validate_num_pages(list(self._pdf_data.values())[-1])]
         tests_result["whole_document_results"].append(document_results)
-        self.write_validation_data(tests_result, self._test_definitions)
+        return self.write_validation_data(tests_result, self._test_definitions)
 
 
 class WcMusicCorpFormatter(BasePDFFormatter):
@@ -228,29 +232,106 @@ class WcMusicCorpFormatter(BasePDFFormatter):
             for table_name, input_df in enhanced_tables_dict.items()
         ]
         return {table["table_name"]: table["df"] for table in formatted_tables}, list(
-            input_page_table_numbers.values()
-        )[self._ignore_tables :]
+            self.route_tables(input_page_table_numbers).values()
+        )
+
+    def format_pdf_data_stream(self, input_page_iterator) -> tuple:
+        """
+        Function to format the input pdf tables as pages are streamed in. Tables are routed to
+        a config table by their column schema, enhanced page by page, and each table is
+        formatted as soon as the document moves on to the next one. Only the raw tables in
+        STREAM_ENHANCEMENT_TABLES are kept once formatted
+        """
+        _LOGGER.info('formatting pdf stream')
+        all_table_schemas = []
+        all_table_indices = []
+        schema_order = {}
+        pending_tables = defaultdict(list)
+        pdf_tables = {}
+        formatted_tables = {}
+        current_table_name = None
+        for page in input_page_iterator:
+            for page_table in page["page_tables"]:
+                schema = tuple(page_table.columns.tolist())
+                all_table_schemas.append(schema)
+                all_table_indices.append(page["page_number"] - 1)
+                table_name = self.get_table_name(
+                    schema, schema_order.setdefault(schema, len(schema_order))
+                )
+                if table_name is None:
+                    continue
+                if current_table_name not in (None, table_name):
+                    self.finalise_stream_table(
+                        current_table_name, pending_tables, pdf_tables, formatted_tables
+                    )
+                current_table_name = table_name
+                table_page = {**page, "page_tables": [page_table]}
+                data_enhancements = self._table_config[table_name].get(
+                    "enhance_table_data", None
+                )
+                if data_enhancements:
+                    table_page = self.enchance_table_data(
+                        [table_page], data_enhancements, pdf_tables
+                    )[0]
+                pending_tables[table_name].extend(table_page["page_tables"])
+        if current_table_name is not None:
+            self.finalise_stream_table(
+                current_table_name, pending_tables, pdf_tables, formatted_tables
+            )
+        return {
+            table_name: formatted_tables[table_name]
+            for table_name in self._table_config
+            if table_name in formatted_tables
+        }, list(
+            self.route_tables(
+                get_schema_pages(all_table_schemas, all_table_indices)
+            ).values()
+        )
+
+    def finalise_stream_table(
+        self,
+        table_name: str,
+        pending_tables: dict,
+        pdf_tables: dict,
+        formatted_tables: dict,
+    ) -> None:
+        """
+        Function to concatenate and format the streamed tables collected for a config table.
+        The raw table is only kept if a later table's enhancements need it. If the
+        document returns to a table it has already moved on from, the new section is
+        formatted on its own and appended to the table's earlier rows
+        """
+        table_data = pd.concat(pending_tables.pop(table_name), ignore_index=True)
+        if table_name in STREAM_ENHANCEMENT_TABLES:
+            pdf_tables[table_name] = pd.concat(
+                ([pdf_tables[table_name]] if table_name in pdf_tables else [])
+                + [table_data],
+                ignore_index=True,
+            )
+        formatted_table = self.apply_table_formatting(table_data, table_name)["df"]
+        if table_name in formatted_tables:
+            _LOGGER.warning(f"{table_name} is split into sections, formatting each alone")
+            formatted_table = pd.concat(
+                [formatted_tables[table_name], formatted_table], ignore_index=True
+            )
+        formatted_tables[table_name] = formatted_table
 
     def match_correct_tables(self, input_page_data: list, input_page_table_numbers: dict) -> dict:
         """
-        FUnction to match the correct tables to the correct pages and data
+        FUnction to match the correct tables to the correct pages and data. Tables are routed
+        to the config tables by their columns, and their pages looked up by page number
         """
         pdf_tables = {}
-        for page_table_numbers, (table_name, table_config) in zip(
-            list(input_page_table_numbers.values())[self._ignore_tables :],
-            self._table_config.items(),
-        ):
+        pages_by_number = {page["page_number"]: page for page in input_page_data}
+        for table_name, page_table_numbers in self.route_tables(
+            input_page_table_numbers
+        ).items():
+            table_config = self._table_config[table_name]
             data_enhancements = table_config.get("enhance_table_data", None)
-            if isinstance(page_table_numbers, int):
-                page_table_numbers_list = [page_table_numbers + 1]
-            elif isinstance(page_table_numbers, range):
-                page_table_numbers_list = list(page_table_numbers) + [
-                    max(page_table_numbers) + 1
-                ]
             corresponding_page_data = [
-                page
-                for page in input_page_data
-                if page["page_number"] in page_table_numbers_list
+                pages_by_number[page_number]
+                for page_number in get_table_page_numbers(page_table_numbers)
+                if page_number in pages_by_number
             ]
             if data_enhancements:
                 pdf_tables[table_name] = pd.concat(
@@ -301,6 +382,16 @@ class WcMusicCorpFormatter(BasePDFFormatter):
         return output_table_data
 
 
+def get_table_page_numbers(page_table_numbers) -> list:
+    """
+    Function to convert the table numbers of a schema, as returned by get_schema_pages, to
+    the page numbers holding those tables
+    """
+    if isinstance(page_table_numbers, int):
+        return [page_table_numbers + 1]
+    return list(page_table_numbers) + [max(page_table_numbers) + 1]
+
+
 def add_page_numbers(input_page_data: list) -> list:
     """
     Function to add page numbers to the input dataframes
@@ -315,12 +406,12 @@ def add_page_numbers(input_page_data: list) -> list:
 
 def add_scope(input_page_data: list, scope_table: pd.DataFrame) -> list:
     """
-    Function to add scope names to the input dataframes
+    Function to add scope names to the input dataframes. The scope names are hashed once,
+    and each line of page text is looked up in them
     """
+    scope_names = set(scope_table["Scope Name"])
     for page in input_page_data:
-        record_scope = set(scope_table["Scope Name"]).intersection(
-            set(page["page_text"]["text"])
-        )
+        record_scope = scope_names.intersection(page["page_text"]["text"])
         if len(record_scope) == 1:
             page["page_tables"] = [
                 table.assign(scope=list(record_scope)[0])
@@ -335,48 +426,60 @@ def add_scope(input_page_data: list, scope_table: pd.DataFrame) -> list:
 
 def extract_track_titles(input_page_data: list) -> list:
     """
-    Function to add track titles to input dataframes
+    Function to add track titles to input dataframes. The page tables are concatenated so
+    that the track titles and totals are extracted for every table in a single pass
     """
-    for page in input_page_data:
-        output_page_tables = []
-        for page_table in page["page_tables"]:
-            if not page_table.empty:
-                page_table["track_information"] = page_table["Income Type"][
-                    page_table["Statement Id"].isna()
-                ]
-                page_table["track_title"] = (
-                    page_table["track_information"]
-                    .fillna(method="ffill")
-                    .str.split("-")
-                    .str[0]
-                    .replace(r"\s+", " ", regex=True)
-                )
-                page_table["track_title"] = page_table["track_title"].apply(
-                    lambda x: x
-                    if re.match(r"\b[A-Z][A-Z]+\b", x) and not "," in x
-                    else None
-                )
-                track_totals = (
-                    page_table["track_information"]
-                    .str.replace(",", "")
-                    .str.extractall(r"(\d+\.\d{3})")
-                    .unstack()
-                )
-                track_totals.columns = track_totals.columns.droplevel()
-                output_df = pd.concat(
-                    [
-                        page_table.drop(columns=["track_information"]),
-                        track_totals.rename(
-                            columns={0: "track_amount_received", 1: "track_amount_paid"}
-                        ),
-                    ],
-                    axis=1,
-                )
-                output_df[["track_amount_received", "track_amount_paid"]] = output_df[
-                    ["track_amount_received", "track_amount_paid"]
-                ].fillna(method="ffill")
-                output_page_tables.append(output_df)
-        page["page_tables"] = output_page_tables
+    page_tables = [
+        [page_table for page_table in page["page_tables"] if not page_table.empty]
+        for page in input_page_data
+    ]
+    table_lengths = [len(page_table) for page_table in chain.from_iterable(page_tables)]
+    if not table_lengths:
+        for page in input_page_data:
+            page["page_tables"] = []
+        return input_page_data
+
+    table_ids = np.repeat(np.arange(len(table_lengths)), table_lengths)
+    royalties = pd.concat(chain.from_iterable(page_tables), ignore_index=True)
+    track_information = royalties["Income Type"][royalties["Statement Id"].isna()]
+    # titles are parsed on the track header rows only, then filled down each table
+    track_headers = track_information.dropna()
+    track_title = (
+        track_headers.str.split("-").str[0].str.replace(r"\s+", " ", regex=True)
+    )
+    track_title = track_title.where(
+        track_title.str.match(r"\b[A-Z][A-Z]+\b")
+        & ~track_title.str.contains(",", regex=False),
+        "",
+    )
+    track_title = track_title.reindex(royalties.index).groupby(table_ids).ffill()
+    royalties["track_title"] = np.where(
+        track_title.notna() & (track_title != ""), track_title, None
+    )
+    track_totals = (
+        track_headers.str.replace(",", "", regex=False)
+        .str.extractall(r"(\d+\.\d{3})")
+        .unstack()
+    )
+    track_totals.columns = track_totals.columns.droplevel()
+    for col, track_total in track_totals.rename(
+        columns={0: "track_amount_received", 1: "track_amount_paid"}
+    ).items():
+        royalties[col] = track_total
+    royalties[["track_amount_received", "track_amount_paid"]] = (
+        royalties[["track_amount_received", "track_amount_paid"]]
+        .groupby(table_ids)
+        .ffill()
+    )
+
+    table_ends = iter(np.cumsum(table_lengths))
+    for page, tables in zip(input_page_data, page_tables):
+        page["page_tables"] = []
+        for page_table in tables:
+            table_end = next(table_ends)
+            page["page_tables"].append(
+                royalties.iloc[table_end - len(page_table) : table_end]
+            )
     return input_page_data
 
 
@@ -5,31 +5,31 @@ import pandas as pd
 
 import musicbrainzngs
 
+from musicie.instrumentation import span
+
 logging.basicConfig(level=logging.INFO)
 logging.getLogger("musicbrainzngs").setLevel(logging.WARNING)
 _LOGGER = logging.getLogger(__file__)
 
-# musicbrainzngs auth and setup
-musicbrainzngs.auth("test_application", "xqL4RTKh@7#9P4cG")
-musicbrainzngs.set_useragent("test_application", "0.1", "http://example.com/music")
-
 
 def browse_artist_recordings(input_artist_id: str, **kwargs) -> list:
     """
     Function to browse recordings given an input artist_id using the musicbrainszngs api
     """
-    no_recordings = musicbrainzngs.browse_recordings(artist=input_artist_id)[
-        "recording-count"
-    ]
+    with span("musicbrainz.browse_recordings"):
+        no_recordings = musicbrainzngs.browse_recordings(artist=input_artist_id)[
+            "recording-count"
+        ]
     _LOGGER.info(f"Paginating: {no_recordings} found")
     recordings = pd.DataFrame()
     for page in range(int(no_recordings / 100) + 1):
+        with span("musicbrainz.browse_recordings") as current_span:
+            recording_list = musicbrainzngs.browse_recordings(
+                artist=input_artist_id, offset=page * 100, **kwargs
+            )["recording-list"]
+            current_span.add(rows=len(recording_list))
         recordings = recordings.append(
-            pd.DataFrame(
-                musicbrainzngs.browse_recordings(
-                    artist=input_artist_id, offset=page * 100, **kwargs
-                )["recording-list"]
-            ),
+            pd.DataFrame(recording_list),
             ignore_index=True,
         ).assign(artist_id=input_artist_id)
     return recordings
@@ -3,11 +3,10 @@ from tqdm import tqdm
 
 import musicbrainzngs
 
-# musicbrainzngs auth and setup
-musicbrainzngs.auth("test_application", "xqL4RTKh@7#9P4cG")
-musicbrainzngs.set_useragent("test_application", "0.1", "http://example.com/music")
+from musicie.instrumentation import instrument
 
 
+@instrument("musicbrainz.get_work_by_id")
 def get_work(work_id: str) -> dict:
     """
     Function to get works given an input artist_id using the musicbrainszngs api
@@ -8,14 +8,14 @@ import pandas as pd
 
 import musicbrainzngs
 
+from musicie.instrumentation import instrument
+
 logging.basicConfig(level=logging.INFO)
 _LOGGER = logging.getLogger(__file__)
 
-# musicbrainzngs auth and setup
-musicbrainzngs.auth("test_application", "xqL4RTKh@7#9P4cG")
-musicbrainzngs.set_useragent("test_application", "0.1", "http://example.com/music")
 
 # musicbrainz functions
+@instrument("musicbrainz.search_recordings")
 def search_recordings(track: str, **kwargs) -> dict:
     """
     Function to search for recordings using the musicbrainszngs api
@@ -23,6 +23,7 @@ def search_recordings(track: str, **kwargs) -> dict:
     return musicbrainzngs.search_recordings(query=track, **kwargs)
 
 
+@instrument("musicbrainz.search_artists")
 def search_artists(artist: str, **kwargs) -> dict:
     """
     Function to search for arists using the musicbrainszngs api
@@ -30,6 +31,7 @@ def search_artists(artist: str, **kwargs) -> dict:
     return musicbrainzngs.search_artists(query=artist, **kwargs)
 
 
+@instrument("musicbrainz.browse_recordings")
 def browse_recordings(artist: str, **kwargs) -> dict:
     """
     Function to broswse recordings for a specific artist using the musicbrainszngs api
@@ -3,6 +3,7 @@ from pathlib import Path
 import pathlib
 import re
 
+import musicbrainzngs
 import pandas as pd
 
 from musicie.exercise_3_artist_recording_universe.artist_recordings import (
@@ -17,7 +18,13 @@ from musicie.exercise_3_artist_recording_universe.artists import (
     get_matched_artists,
     format_artists,
 )
-from musicie.utils import write_data_to_s3, write_data_to_sql, read_data_from_excel, write_data_to_csv
+from musicie.utils import (
+    write_data_to_s3,
+    write_data_to_sql,
+    read_data_from_excel,
+    write_data_to_csv,
+    write_data_to_parquet,
+)
 
 # logging
 logging.basicConfig(level=logging.INFO)
@@ -78,18 +85,29 @@ def format_tables_for_download(input_tables_dict: dict) -> dict:
     }
 
 
+def setup_musicbrainzngs() -> None:
+    """
+    Function to authenticate with, and set the user agent for, the musicbrainz api. This is
+    run when the exercise is run, rather than when the modules are imported
+    """
+    musicbrainzngs.auth("test_application", "xqL4RTKh@7#9P4cG")
+    musicbrainzngs.set_useragent("test_application", "0.1", "http://example.com/music")
+
+
 def run_exercise(
     input_folder: pathlib.Path,
     output_folder: str,
     write_mode=False,
     database_config=None,
-    aws_config=None
+    aws_config=None,
+    write_parquet=False,
 ) -> None:
     """
     Function to run the code for the exercise
     """
     exercise_number = re.search(r".*(\d+).*", Path(__file__).parent.name).group(1)
     _LOGGER.info(f"Running Exercise {exercise_number}")
+    setup_musicbrainzngs()
     artists_to_match = read_data_from_excel(
         Path(input_folder) / "Artists to match_vF.xlsx"
     )
@@ -116,6 +134,13 @@ def run_exercise(
             index=False,
             encoding='utf-8-sig'
         )
+        if write_parquet:
+            write_data_to_parquet(
+                format_tables_for_download(
+                    {**artist_outputs, **recording_outputs, **work_outputs}
+                ),
+                Path(output_folder) / Path(__file__).parent.name,
+            )
         if aws_config is not None:
             write_data_to_s3(
                 format_tables_for_download(
@@ -130,6 +155,7 @@ def run_exercise(
                 format_tables_for_download(
                     {**artist_outputs, **recording_outputs, **work_outputs}
                 ),
-                if_exists="replace",
+                if_exists="truncate",
                 index=False,
+                postgres_yaml=database_config,
             )
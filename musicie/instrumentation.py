@@ -0,0 +1,209 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+import json
+import logging
+import os
+from pathlib import Path
+import pathlib
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+_LOGGER = logging.getLogger(__file__)
+
+# set to the profile folder while profiling, so that worker processes record their spans too
+PROFILE_DIR_ENV = "MUSICIE_PROFILE_DIR"
+
+_LOCAL = threading.local()
+_WRITE_LOCK = threading.Lock()
+
+
+class Span:
+    """
+    Class to hold the timings, and any bytes and row counts, of one instrumented stage
+    """
+    def __init__(self, name: str, parent=None, **attributes):
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self.rows = 0
+        self.bytes = 0
+        self.start = time.time()
+        self.wall_seconds = 0.0
+        # the cpu time of the thread running the span, which excludes any other threads and
+        # processes (e.g. tabula-java or pool workers) doing work for it
+        self.thread_cpu_seconds = 0.0
+
+    def add(self, rows=0, bytes=0) -> None: #pylint:disable=redefined-builtin
+        """
+        Function to add to the rows and bytes processed by the span
+        """
+        self.rows += rows
+        self.bytes += bytes
+
+    def to_dict(self) -> dict:
+        """
+        Function to convert the span to a json serializable dictionary
+        """
+        return {
+            "name": self.name,
+            "parent": self.parent,
+            "start": self.start,
+            "wall_seconds": self.wall_seconds,
+            "thread_cpu_seconds": self.thread_cpu_seconds,
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "attributes": self.attributes,
+        }
+
+
+def is_profiling() -> bool:
+    """
+    Function to check whether spans are being recorded
+    """
+    return PROFILE_DIR_ENV in os.environ
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Context manager to record the wall time, thread cpu time, bytes and rows of a stage. The
+    cpu time is only that of the current thread, and is recorded as thread_cpu_seconds.
+    Yields the span, so bytes and rows can be added with span.add. Nothing is recorded
+    unless profiling has been started
+    """
+    parents = getattr(_LOCAL, "parents", None)
+    if parents is None:
+        parents = _LOCAL.parents = []
+    current_span = Span(name, parents[-1] if parents else None, **attributes)
+    parents.append(name)
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield current_span
+    finally:
+        current_span.wall_seconds = time.perf_counter() - wall_start
+        current_span.thread_cpu_seconds = time.thread_time() - cpu_start
+        parents.pop()
+        if is_profiling():
+            record_span(current_span)
+
+
+def instrument(name: str):
+    """
+    Decorator to record every call of a function as a span
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_span(input_span: Span) -> None:
+    """
+    Function to append a finished span to this process's span file in the profile folder
+    """
+    span_path = Path(os.environ[PROFILE_DIR_ENV]) / f"spans-{os.getpid()}.jsonl"
+    with _WRITE_LOCK:
+        with open(span_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(input_span.to_dict(), default=str) + "\n")
+
+
+def start_profiling(profile_dir: pathlib.Path) -> None:
+    """
+    Function to start recording spans to the profile folder, clearing any previous spans
+    """
+    profile_dir = Path(profile_dir)
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    for span_path in profile_dir.glob("spans-*.jsonl"):
+        span_path.unlink()
+    os.environ[PROFILE_DIR_ENV] = str(profile_dir)
+
+
+def read_spans(profile_dir: pathlib.Path) -> list:
+    """
+    Function to read the spans recorded by every process, in start order
+    """
+    spans = []
+    for span_path in Path(profile_dir).glob("spans-*.jsonl"):
+        with open(span_path, "r", encoding="utf-8") as f:
+            spans.extend(json.loads(line) for line in f)
+    return sorted(spans, key=lambda x: x["start"])
+
+
+def format_trace(spans: list) -> dict:
+    """
+    Function to format spans as a chrome trace, which can be opened in chrome://tracing or
+    https://ui.perfetto.dev
+    """
+    return {
+        "traceEvents": [
+            {
+                "name": x["name"],
+                "ph": "X",
+                "ts": x["start"] * 1e6,
+                "dur": x["wall_seconds"] * 1e6,
+                "pid": x["pid"],
+                "tid": x["tid"],
+                "args": {
+                    "thread_cpu_seconds": x["thread_cpu_seconds"],
+                    "rows": x["rows"],
+                    "bytes": x["bytes"],
+                    **x["attributes"],
+                },
+            }
+            for x in spans
+        ],
+        "displayTimeUnit": "ms",
+    }
+
+
+def format_prometheus(spans: list) -> str:
+    """
+    Function to format the totals of each span name in the prometheus text format
+    """
+    totals = defaultdict(lambda: defaultdict(float))
+    for x in spans:
+        totals[x["name"]]["calls"] += 1
+        for metric in ["wall_seconds", "thread_cpu_seconds", "rows", "bytes"]:
+            totals[x["name"]][metric] += x[metric]
+    lines = []
+    for metric, help_text in PROMETHEUS_METRICS.items():
+        lines.append(f"# HELP musicie_span_{metric}_total {help_text}")
+        lines.append(f"# TYPE musicie_span_{metric}_total counter")
+        lines.extend(
+            f'musicie_span_{metric}_total{{span="{name}"}} {span_totals[metric]:g}'
+            for name, span_totals in sorted(totals.items())
+        )
+    return "\n".join(lines) + "\n"
+
+
+def write_profile(profile_dir: pathlib.Path) -> None:
+    """
+    Function to stop profiling, and write the spans from every process as a json trace
+    (trace.json) and a prometheus text snapshot (metrics.prom) in the profile folder
+    """
+    os.environ.pop(PROFILE_DIR_ENV, None)
+    spans = read_spans(profile_dir)
+    with open(Path(profile_dir) / "trace.json", "w", encoding="utf-8") as f:
+        json.dump(format_trace(spans), f)
+    with open(Path(profile_dir) / "metrics.prom", "w", encoding="utf-8") as f:
+        f.write(format_prometheus(spans))
+    _LOGGER.info(f"wrote profile of {len(spans)} spans to {profile_dir}")
+
+
+PROMETHEUS_METRICS = {
+    "calls": "Number of times the span was run",
+    "wall_seconds": "Wall time spent in the span",
+    "thread_cpu_seconds": (
+        "Cpu time of the thread running the span, excluding other threads and processes"
+    ),
+    "rows": "Rows processed in the span",
+    "bytes": "Bytes processed in the span",
+}
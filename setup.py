@@ -16,12 +16,18 @@ setup(
         'pandas==1.3.2',
         'pdfkit==0.6.1',
         'pdfplumber==0.5.28',
+        "pyarrow==5.0.0",
         "pypdf2==1.26.0",
         'pyyaml==5.4.1',
         'sqlalchemy==1.4.23',
         'tabula-py==2.2.0',
         'tqdm==4.62.1'
     ],
+    extras_require={
+        'benchmarks': ['reportlab==3.6.1'],
+        'tests': ['moto[s3]>=5', 'psycopg2-binary', 'pytest'],
+        'zstd': ['zstandard==0.15.2']
+    },
     entry_points={
         'console_scripts': ['musicie = musicie.cli:cli']
     }
@@ -0,0 +1,50 @@
+import os
+
+import pytest
+import sqlalchemy
+
+from musicie import utils
+
+
+def drop_tables(engine: sqlalchemy.engine.Engine) -> None:
+    """
+    Function to drop every table in the test database
+    """
+    with engine.begin() as connection:
+        for table_name in sqlalchemy.inspect(connection).get_table_names():
+            connection.execute(sqlalchemy.text(f'DROP TABLE "{table_name}" CASCADE'))
+
+
+@pytest.fixture
+def sql_engine(monkeypatch):
+    """
+    Fixture to point the sql sinks at the scratch postgres database in
+    MUSICIE_TEST_DATABASE_URL, skipping the test if it isn't set. Every table in the
+    database is dropped before and after the test
+    """
+    database_url = os.environ.get("MUSICIE_TEST_DATABASE_URL")
+    if database_url is None:
+        pytest.skip("MUSICIE_TEST_DATABASE_URL isn't set")
+    engine = sqlalchemy.create_engine(database_url)
+    monkeypatch.setattr(utils, "get_engine", lambda postgres_yaml=None: engine)
+    drop_tables(engine)
+    yield engine
+    drop_tables(engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def s3_client(monkeypatch):
+    """
+    Fixture to point the s3 sinks at moto's in-memory s3, with the bucket created, skipping
+    the test if moto isn't installed
+    """
+    moto = pytest.importorskip("moto")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.delenv("S3_ENDPOINT_URL", raising=False)
+    with moto.mock_aws():
+        s3 = utils.get_s3_client()
+        s3.create_bucket(Bucket=utils.S3_BUCKET)
+        yield s3
@@ -0,0 +1,100 @@
+import pandas as pd
+
+from musicie.exercise_1_ingest_structure_pdf_royalty_statements.base_pdf_formatter import (
+    ExpandedTables,
+    col_types,
+    compact_dtypes,
+    compile_format_plan,
+    expand_dtypes,
+    fill_na_values,
+    parse_col_types,
+    replace_values,
+)
+
+
+def test_compact_dtypes_scales_money_held_to_the_money_scale():
+    input_df = pd.DataFrame({"amount_paid": [792.518, 1.235, None]})
+
+    compacted_df = compact_dtypes(input_df, money=["amount_paid"])
+
+    assert str(compacted_df["amount_paid"].dtype) == "Int64"
+    pd.testing.assert_frame_equal(expand_dtypes(compacted_df), input_df)
+
+
+def test_compact_dtypes_keeps_money_finer_than_the_money_scale():
+    input_df = pd.DataFrame(
+        {"amount_paid": [0.0004, 1.23456], "amount_received": [1.5, 2.25]}
+    )
+
+    compacted_df = compact_dtypes(input_df, money=["amount_paid", "amount_received"])
+
+    assert compacted_df["amount_paid"].dtype == "float64"
+    assert compacted_df["amount_received"].dtype == "int64"
+    pd.testing.assert_frame_equal(expand_dtypes(compacted_df), input_df)
+
+
+def test_expanded_tables_can_keep_the_compacted_dtypes():
+    input_df = pd.DataFrame(
+        {"scope": ["UK", "UK"], "page_number": [1, 2], "amount_paid": [1.5, 2.25]}
+    )
+    compacted_df = compact_dtypes(
+        input_df, categories=["scope"], integers=["page_number"], money=["amount_paid"]
+    )
+
+    expanded_df = ExpandedTables({"music_royalties": compacted_df}, money_only=True)[
+        "music_royalties"
+    ]
+
+    assert expanded_df["scope"].dtype == "category"
+    assert expanded_df["page_number"].dtype == "int8"
+    assert expanded_df["amount_paid"].tolist() == [1.5, 2.25]
+    pd.testing.assert_frame_equal(
+        ExpandedTables({"music_royalties": compacted_df})["music_royalties"], input_df
+    )
+
+
+def run_format_plan(input_df: pd.DataFrame, table_config: dict) -> pd.DataFrame:
+    """
+    Function to run the compiled format plan of a table config on a dataframe
+    """
+    for func, args, kwargs in compile_format_plan(table_config):
+        input_df = func(input_df, *args, **kwargs)
+    return input_df
+
+
+def test_replace_values_is_kept_in_order_before_an_intervening_step():
+    table_config = {
+        "replace_values": {"replace_config": {"@": "", ",": ""}},
+        "fillna": {"how": {"scope": "ffill"}},
+        "col_types": {"type_mappings": {"amount_paid": float}},
+    }
+
+    formatted_df = run_format_plan(
+        pd.DataFrame({"scope": ["@UK", None], "amount_paid": ["1,000.5", "@2"]}),
+        table_config,
+    )
+
+    assert [func for func, _, _ in compile_format_plan(table_config)] == [
+        replace_values,
+        fill_na_values,
+        col_types,
+    ]
+    # the replacements run on every column, before the scope is filled down
+    assert formatted_df["scope"].tolist() == ["UK", "UK"]
+    assert formatted_df["amount_paid"].tolist() == [1000.5, 2.0]
+
+
+def test_adjacent_replace_values_is_fused_into_col_types():
+    table_config = {
+        "replace_values": {"replace_config": {",": "", "cols": ["amount_paid"]}},
+        "col_types": {"type_mappings": {"amount_paid": float, "units": float}},
+    }
+
+    formatted_df = run_format_plan(
+        pd.DataFrame({"amount_paid": ["1,000.5"], "units": ["3"]}), table_config
+    )
+
+    assert [func for func, _, _ in compile_format_plan(table_config)] == [
+        parse_col_types
+    ]
+    assert formatted_df.to_dict("list") == {"amount_paid": [1000.5], "units": [3.0]}
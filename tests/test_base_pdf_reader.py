@@ -0,0 +1,131 @@
+import subprocess
+
+import pytest
+
+from musicie.exercise_1_ingest_structure_pdf_royalty_statements.base_pdf_reader import (
+    BasePDFReader,
+    check_template_tables,
+    get_template_key,
+    learn_table_templates,
+)
+
+PAGE_HEIGHT = 595.0
+
+
+def get_cell(text: str, top: float, left: float) -> dict:
+    """
+    Function to return a cell of tabula's json output
+    """
+    return {"text": text, "top": top, "left": left, "width": 40.0, "height": 4.0}
+
+
+def get_page_json(row_tops: list) -> list:
+    """
+    Function to return tabula's json output for a page holding a single two column table,
+    with a header row and a row at each of row_tops
+    """
+    rows = [[get_cell("Track Title", 80.0, 10.0), get_cell("Amount Paid", 80.0, 100.0)]]
+    rows += [
+        [get_cell(f"track {i}", top, 10.0), get_cell(f"{i}.000", top, 100.0)]
+        for i, top in enumerate(row_tops)
+    ]
+    return [
+        {
+            "extraction_method": "stream",
+            "top": 79.0,
+            "bottom": row_tops[-1] + 4.0,
+            "right": 140.0,
+            "data": rows,
+        }
+    ]
+
+
+def test_learned_template_area_runs_to_the_bottom_of_the_page():
+    (template,) = learn_table_templates(
+        [get_page_json([92.0, 104.0]), get_page_json([92.0, 104.0, 116.0])],
+        PAGE_HEIGHT,
+    )
+
+    assert template["area"][2] == PAGE_HEIGHT
+    assert template["columns"] == ["track_title", "amount_paid"]
+    # a longer table than those on the sample pages passes the check
+    assert check_template_tables(
+        get_page_json([92.0 + 12 * i for i in range(30)]), template
+    )
+
+
+def test_check_template_tables_rejects_text_below_the_table():
+    (template,) = learn_table_templates(
+        [get_page_json([92.0, 104.0]), get_page_json([92.0, 104.0, 116.0])],
+        PAGE_HEIGHT,
+    )
+
+    assert not check_template_tables(get_page_json([92.0, 104.0, 580.0]), template)
+
+
+def test_template_settings_change_the_cache_key():
+    template_keys = {
+        get_template_key(None, 0),
+        get_template_key(None, 20),
+        get_template_key(None, 10),
+        get_template_key([{"columns": ["track_title"]}], 20),
+        get_template_key([{"columns": ["amount_paid"]}], 20),
+    }
+
+    assert len(template_keys) == 5
+
+
+def get_stand_in_reader(bad_pages, launches: list) -> BasePDFReader:
+    """
+    Function to return a reader whose tabula and pdfplumber passes are stood in for, failing
+    any pass that includes one of bad_pages, and recording the pages of each pass in launches
+    """
+    reader = BasePDFReader("statement.pdf")
+
+    def get_batch_pdf_text(page_numbers):
+        launches.append(page_numbers)
+        if set(page_numbers).intersection(bad_pages):
+            raise subprocess.CalledProcessError(1, ["java"])
+        return {page_no: f"page {page_no}" for page_no in page_numbers}, {}
+
+    reader.learn_page_templates = lambda page_numbers: {}
+    reader.get_batch_pdf_text = get_batch_pdf_text
+    reader.get_batch_pdf_tables = lambda page_numbers, page_templates: {
+        page_no: [] for page_no in page_numbers
+    }
+    return reader
+
+
+def test_failing_page_is_skipped():
+    reader = get_stand_in_reader({6}, [])
+
+    page_data = reader.extract_pages(list(range(1, 9)))
+
+    assert [page["page_number"] for page in page_data] == list(range(1, 9))
+    assert [page["page_number"] for page in page_data if "page_error" in page] == [6]
+
+
+def test_document_fails_when_no_page_can_be_extracted():
+    launches = []
+    reader = get_stand_in_reader(set(range(1, 9)), launches)
+
+    with pytest.raises(subprocess.CalledProcessError):
+        reader.extract_pages(list(range(1, 9)))
+    # the pages are only split until the first page fails on its own
+    assert launches == [list(range(1, 9)), [1, 2, 3, 4], [1, 2], [1]]
+
+
+def test_other_errors_fail_the_document():
+    launches = []
+    reader = get_stand_in_reader(set(), launches)
+
+    def learn_page_templates(page_numbers):
+        launches.append(page_numbers)
+        raise FileNotFoundError("java")
+
+    reader.learn_page_templates = learn_page_templates
+
+    with pytest.raises(FileNotFoundError):
+        reader.extract_pages(list(range(1, 9)))
+    # the pages aren't split to look for a failing page
+    assert launches == [list(range(1, 9))]
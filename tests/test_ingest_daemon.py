@@ -0,0 +1,80 @@
+import os
+import time
+
+import pytest
+
+from musicie.exercise_1_ingest_structure_pdf_royalty_statements import ingest_daemon
+from musicie.exercise_1_ingest_structure_pdf_royalty_statements.ingest_daemon import (
+    JobQueue,
+    get_settled_pdf_files,
+    run_daemon,
+)
+
+
+def write_pdf(pdf_file, contents: bytes, modified_at: float) -> None:
+    """
+    Function to write a stand in pdf with the given contents and modified time
+    """
+    pdf_file.write_bytes(contents)
+    os.utime(pdf_file, (modified_at, modified_at))
+
+
+def test_replaced_pdf_is_queued_again(tmp_path):
+    input_folder = tmp_path / "inputs"
+    input_folder.mkdir()
+    pdf_file = input_folder / "statement.pdf"
+    write_pdf(pdf_file, b"first statement", time.time() - 60)
+    job_queue = JobQueue(tmp_path / "queue.sqlite")
+
+    assert job_queue.enqueue(get_settled_pdf_files(input_folder, 5.0)) == 1
+    ((job_id, _),) = job_queue.claim(1)
+    job_queue.complete(job_id, "FIRST")
+    # scanning the same version of the pdf again doesn't queue it
+    assert job_queue.enqueue(get_settled_pdf_files(input_folder, 5.0)) == 0
+
+    write_pdf(pdf_file, b"second statement", time.time() - 30)
+
+    assert job_queue.enqueue(get_settled_pdf_files(input_folder, 5.0)) == 1
+    assert job_queue.claim(1) == [(job_id + 1, pdf_file)]
+    job_queue.close()
+
+
+def crash_on_first_pdf(pdf_file, *args, **kwargs) -> str:
+    """
+    Function to stand in for run_job, killing its worker process on the pdf named first
+    """
+    if pdf_file.stem == "first":
+        os._exit(1)
+    return pdf_file.stem.upper()
+
+
+def test_daemon_recovers_from_a_dead_worker(tmp_path, monkeypatch):
+    input_folder = tmp_path / "inputs"
+    input_folder.mkdir()
+    write_pdf(input_folder / "first.pdf", b"first statement", time.time() - 60)
+    write_pdf(input_folder / "second.pdf", b"second statement", time.time() - 30)
+    monkeypatch.setattr(ingest_daemon, "run_job", crash_on_first_pdf)
+
+    queue_depth = run_daemon(
+        input_folder,
+        str(tmp_path / "outputs"),
+        tmp_path / "queue.sqlite",
+        poll_interval=0.1,
+        settle_seconds=0.0,
+        max_attempts=1,
+        once=True,
+    )
+
+    assert queue_depth == {"pending": 0, "running": 0, "done": 1, "failed": 1}
+
+
+def test_daemon_needs_incremental_mode_to_write_to_sql(tmp_path):
+    with pytest.raises(ValueError):
+        run_daemon(
+            tmp_path,
+            str(tmp_path / "outputs"),
+            tmp_path / "queue.sqlite",
+            write_mode=True,
+            database_config="postgres_config.yaml",
+            once=True,
+        )
@@ -0,0 +1,18 @@
+import json
+
+from musicie.instrumentation import span, start_profiling, write_profile
+
+
+def test_profile_labels_cpu_time_as_thread_cpu(tmp_path):
+    start_profiling(tmp_path)
+    with span("pdf.extraction") as current_span:
+        current_span.add(rows=3)
+    write_profile(tmp_path)
+
+    with open(tmp_path / "trace.json", "r", encoding="utf-8") as f:
+        (trace_event,) = json.load(f)["traceEvents"]
+    metrics = (tmp_path / "metrics.prom").read_text(encoding="utf-8")
+    assert "thread_cpu_seconds" in trace_event["args"]
+    assert "cpu_seconds" not in trace_event["args"]
+    assert 'musicie_span_thread_cpu_seconds_total{span="pdf.extraction"}' in metrics
+    assert "musicie_span_cpu_seconds_total" not in metrics
@@ -0,0 +1,34 @@
+import pandas as pd
+
+from musicie.exercise_1_ingest_structure_pdf_royalty_statements.royalty_store import (
+    RoyaltyStore,
+)
+
+
+def test_statement_with_an_extra_column_is_appended(tmp_path):
+    royalty_store = RoyaltyStore(tmp_path / "royalty_store.sqlite")
+    royalty_store.append_statement(
+        "FIRST",
+        "2021-01-31",
+        {"music_royalties": pd.DataFrame({"scope": ["A"], "amount_paid": [1.5]})},
+    )
+
+    royalty_store.append_statement(
+        "SECOND",
+        "2021-04-30",
+        {
+            "music_royalties": pd.DataFrame(
+                {"scope": ["A"], "amount_paid": [2.0], "extra": [7]}
+            )
+        },
+    )
+
+    rows = royalty_store.query(
+        "SELECT unique_id, amount_paid, extra FROM music_royalties ORDER BY unique_id"
+    )
+    royalty_store.close()
+    assert rows["unique_id"].tolist() == ["FIRST", "SECOND"]
+    assert rows["amount_paid"].tolist() == [1.5, 2.0]
+    # the earlier statement has no value for the added column
+    assert rows["extra"].isna().tolist() == [True, False]
+    assert rows["extra"].iloc[1] == 7
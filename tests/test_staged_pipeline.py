@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+from musicie.exercise_1_ingest_structure_pdf_royalty_statements.staged_pipeline import (
+    StagedPipeline,
+)
+
+
+def sleep_for(seconds: float) -> float:
+    """
+    Function to stand in for a pipeline stage, sleeping for the item's seconds, and failing
+    on a negative number of seconds
+    """
+    if seconds < 0:
+        raise ValueError("negative seconds")
+    time.sleep(seconds)
+    return seconds
+
+
+def test_ordered_stage_runs_items_in_feed_order():
+    written = []
+    pipeline = StagedPipeline(
+        [("process", sleep_for, 4), ("write", written.append, 1)],
+        ordered_stages=["write"],
+    )
+
+    pipeline.run([(i, seconds) for i, seconds in enumerate([0.2, -1, 0.1, 0.0, 0.15])])
+
+    assert written == [0.2, 0.1, 0.0, 0.15]
+
+
+def test_ordered_stage_needs_a_single_worker():
+    with pytest.raises(ValueError):
+        StagedPipeline([("write", print, 2)], ordered_stages=["write"])
+
+
+def test_items_held_back_by_an_ordered_stage_are_bounded():
+    started = []
+
+    def record_start(seconds: float) -> int:
+        started.append(seconds)
+        time.sleep(seconds)
+        return len(started)
+
+    written = []
+    pipeline = StagedPipeline(
+        [("process", record_start, 2), ("write", written.append, 1)],
+        ordered_stages=["write"],
+    )
+
+    pipeline.run([(i, seconds) for i, seconds in enumerate([0.3] + [0.0] * 20)])
+
+    # while the first item is slow, only the items the write stage's queue, and the process
+    # stage's queue and two workers, can hold are fed in, rather than every other item
+    # being held back by the write stage
+    assert written[0] <= 1 + (1 + 2)
+    assert len(written) == 21
@@ -0,0 +1,98 @@
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from musicie.exercise_1_ingest_structure_pdf_royalty_statements import (
+    extraction_cache,
+    task_1,
+)
+from musicie.exercise_1_ingest_structure_pdf_royalty_statements.extraction_cache import (
+    ExtractionCache,
+    get_file_hash,
+)
+
+
+def test_already_loaded_pdfs_are_skipped(tmp_path, sql_engine, monkeypatch):
+    monkeypatch.setattr(task_1, "get_engine", lambda postgres_yaml=None: sql_engine)
+    pdf_files = []
+    for name in ["loaded", "new", "copy_of_new"]:
+        pdf_files.append(tmp_path / f"{name}.pdf")
+        pdf_files[-1].write_bytes(b"loaded statement" if name == "loaded" else b"new")
+    task_1.record_loaded_statement(
+        "LOADED", get_file_hash(pdf_files[0]), "postgres_config.yaml"
+    )
+
+    pdf_files_to_load = task_1.get_pdf_files_to_load(pdf_files, "postgres_config.yaml")
+
+    # pdfs with the same contents are only loaded once, and keep the hash computed here
+    assert pdf_files_to_load == {pdf_files[1]: get_file_hash(pdf_files[1])}
+
+
+def test_cache_key_reuses_a_computed_hash(tmp_path, monkeypatch):
+    pdf_file = tmp_path / "statement.pdf"
+    pdf_file.write_bytes(b"statement")
+    cache = ExtractionCache("1", cache_folder=tmp_path / "cache")
+    content_hash = get_file_hash(pdf_file)
+
+    def fail_to_hash(file_path):
+        raise AssertionError(f"{file_path} hashed again")
+
+    monkeypatch.setattr(extraction_cache, "get_file_hash", fail_to_hash)
+
+    assert cache.get_key(pdf_file, content_hash) == f"{content_hash}_1"
+
+
+def test_parquet_is_typed_from_the_format_config(tmp_path):
+    formatter = task_1.get_class("wc_music_corp", "formatter")(
+        task_1.CONFIG["wc_music_corp"]["format_pdf_config"]
+    )
+    pdf_table_data = formatter.compact_pdf_data(
+        {
+            "music_royalties": pd.DataFrame(
+                {
+                    "income_type": ["Streaming", "Streaming"],
+                    "statement_id": [1, 2],
+                    "units": [10, 20],
+                    "amount_received": [1.5, 2.25],
+                    "royalty_rate": [0.5, 0.5],
+                    "amount_paid": [0.75, 1.125],
+                    "scope": ["UK", "UK"],
+                    "track_title": ["track", "track"],
+                    "track_amount_received": ["3.75", "3.75"],
+                    "track_amount_paid": ["1.875", "1.875"],
+                    "page_number": [1, 1],
+                }
+            )
+        }
+    )
+
+    task_1.write_pdf_data(
+        "TEST",
+        pdf_table_data,
+        str(tmp_path),
+        write_parquet=True,
+        parquet_schemas=formatter.get_parquet_schemas(),
+    )
+
+    parquet_schema = pq.read_schema(
+        tmp_path
+        / Path(task_1.__file__).parent.name
+        / "TEST"
+        / "music_royalties.parquet"
+    )
+    assert {field.name: field.type for field in parquet_schema} == {
+        "income_type": pa.string(),
+        "statement_id": pa.int64(),
+        "units": pa.int64(),
+        "amount_received": pa.float64(),
+        "royalty_rate": pa.float64(),
+        "amount_paid": pa.float64(),
+        "scope": pa.string(),
+        "track_title": pa.string(),
+        "track_amount_received": pa.string(),
+        "track_amount_paid": pa.string(),
+        "page_number": pa.int64(),
+        "Datestamp": pa.timestamp("us"),
+    }
@@ -0,0 +1,197 @@
+from io import BytesIO
+
+import pandas as pd
+import pytest
+import sqlalchemy
+
+from musicie.utils import (
+    S3_BUCKET,
+    S3_PART_BYTES,
+    get_create_table_sqls,
+    get_load_levels,
+    write_data_to_sql,
+    write_dataframe_to_sql,
+    write_object_to_s3,
+)
+
+SCHEMA_SQL = """CREATE TABLE "TestDim" (
+  "Id" varchar PRIMARY KEY,
+  "Name" varchar NOT NULL,
+  "Datestamp" datetime NOT NULL
+);
+
+CREATE TABLE "TestMapping" (
+  "Id" varchar NOT NULL,
+  "DimKey" varchar NOT NULL,
+  "Datestamp" datetime NOT NULL
+);
+
+ALTER TABLE "TestMapping" ADD FOREIGN KEY ("DimKey") REFERENCES "TestDim" ("Id");
+"""
+
+
+@pytest.fixture
+def schema_sql_path(tmp_path):
+    """
+    Fixture to write a schema sql with a mapping table referencing a dim table
+    """
+    schema_sql_path = tmp_path / "database_schema_code.sql"
+    schema_sql_path.write_text(SCHEMA_SQL, encoding="utf-8")
+    return schema_sql_path
+
+
+def get_tables(dim_ids: list) -> dict:
+    """
+    Function to return a dim table with dim_ids, and a mapping table referencing them
+    """
+    return {
+        "TestMapping": pd.DataFrame(
+            {"Id": [f"m{dim_id}" for dim_id in dim_ids], "DimKey": dim_ids}
+        ),
+        "TestDim": pd.DataFrame(
+            {"Id": dim_ids, "Name": [f"name {dim_id}" for dim_id in dim_ids]}
+        ),
+    }
+
+
+def read_ids(engine: sqlalchemy.engine.Engine, table_name: str) -> list:
+    """
+    Function to return the sorted ids of a table
+    """
+    with engine.connect() as connection:
+        return sorted(
+            row[0]
+            for row in connection.execute(sqlalchemy.text(f'SELECT "Id" FROM "{table_name}"'))
+        )
+
+
+def test_get_load_levels_loads_referenced_tables_first(schema_sql_path):
+    assert get_load_levels(["TestMapping", "Other", "TestDim"], schema_sql_path) == [
+        ["Other", "TestDim"],
+        ["TestMapping"],
+    ]
+
+
+def test_get_create_table_sqls_translates_types(schema_sql_path):
+    create_table_sql = get_create_table_sqls(schema_sql_path)["TestDim"]
+    assert '"Datestamp" timestamp NOT NULL' in create_table_sql
+    assert '"Id" varchar PRIMARY KEY' in create_table_sql
+
+
+def test_write_data_to_sql_truncates_tables_with_foreign_keys(
+    sql_engine, schema_sql_path
+):
+    write_data_to_sql(get_tables(["a", "b"]), schema_sql_path=schema_sql_path)
+    # the tables are created from the schema sql, rather than from the dataframes
+    columns = {
+        column["name"]: column["type"]
+        for column in sqlalchemy.inspect(sql_engine).get_columns("TestDim")
+    }
+    assert isinstance(columns["Datestamp"], sqlalchemy.TIMESTAMP)
+    with sql_engine.begin() as connection:
+        connection.execute(
+            sqlalchemy.text(
+                'ALTER TABLE "TestMapping" ADD FOREIGN KEY ("DimKey") '
+                'REFERENCES "TestDim" ("Id")'
+            )
+        )
+
+    write_data_to_sql(get_tables(["c"]), schema_sql_path=schema_sql_path)
+
+    assert read_ids(sql_engine, "TestDim") == ["c"]
+    assert read_ids(sql_engine, "TestMapping") == ["mc"]
+
+
+def test_write_data_to_sql_appends(sql_engine, schema_sql_path):
+    write_data_to_sql(get_tables(["a"]), schema_sql_path=schema_sql_path)
+    write_data_to_sql(
+        get_tables(["b"]), if_exists="append", schema_sql_path=schema_sql_path
+    )
+
+    assert read_ids(sql_engine, "TestDim") == ["a", "b"]
+    assert read_ids(sql_engine, "TestMapping") == ["ma", "mb"]
+
+
+def test_write_dataframe_to_sql_upserts_by_key(sql_engine):
+    write_dataframe_to_sql(
+        pd.DataFrame({"Id": ["1", "2", "3"], "UniqueId": ["x", "x", "y"]}),
+        "TestStatement",
+        if_exists="upsert",
+        upsert_key="UniqueId",
+    )
+    write_dataframe_to_sql(
+        pd.DataFrame({"Id": ["4"], "UniqueId": ["x"]}),
+        "TestStatement",
+        if_exists="upsert",
+        upsert_key="UniqueId",
+    )
+
+    assert read_ids(sql_engine, "TestStatement") == ["3", "4"]
+
+
+def get_dim_artist(begin: list) -> pd.DataFrame:
+    """
+    Function to return a DimArtist table, as written by exercise 3, with the begin dates
+    """
+    return pd.DataFrame(
+        {
+            "Id": [f"artist {i}" for i in range(len(begin))],
+            "Type": "Group",
+            "Name": [f"name {i}" for i in range(len(begin))],
+            "Country": "US",
+            "Disambiguation": None,
+            "Gender": None,
+            "Begin": begin,
+            "End": None,
+            "Ended": True,
+        }
+    )
+
+
+def get_column_type(engine: sqlalchemy.engine.Engine, table_name: str, col: str) -> str:
+    """
+    Function to return the postgres type of a column
+    """
+    with engine.connect() as connection:
+        return connection.execute(
+            sqlalchemy.text(
+                "SELECT data_type FROM information_schema.columns "
+                "WHERE table_name = :table_name AND column_name = :col"
+            ),
+            {"table_name": table_name, "col": col},
+        ).scalar()
+
+
+def test_write_dataframe_to_sql_creates_table_from_year_only_dates(sql_engine):
+    write_dataframe_to_sql(get_dim_artist(["1969", None]), "DimArtist")
+
+    # the years don't fit the schema sql's date type, so the table takes the dataframe's
+    assert get_column_type(sql_engine, "DimArtist", "Begin") == "text"
+    with sql_engine.connect() as connection:
+        assert connection.execute(
+            sqlalchemy.text('SELECT "Begin" FROM "DimArtist" ORDER BY "Id"')
+        ).scalars().all() == ["1969", None]
+
+
+def test_write_dataframe_to_sql_creates_table_from_schema_sql(sql_engine):
+    write_dataframe_to_sql(get_dim_artist(["1969-01-01", None]), "DimArtist")
+
+    assert get_column_type(sql_engine, "DimArtist", "Begin") == "date"
+    assert read_ids(sql_engine, "DimArtist") == ["artist 0", "artist 1"]
+
+
+def test_write_object_to_s3_uploads_large_csvs_in_parts(s3_client):
+    input_df = pd.DataFrame(
+        {"Id": range(400_000), "Name": [f"track {i:032d}" for i in range(400_000)]}
+    )
+
+    write_object_to_s3(input_df, "trans", "TestDim", "csv", index=False)
+
+    (s3_object,) = s3_client.list_objects_v2(Bucket=S3_BUCKET)["Contents"]
+    # the csv isn't compressed, or renamed, by default
+    assert s3_object["Key"].endswith("/TestDim.csv")
+    assert s3_object["Size"] > S3_PART_BYTES
+    # multipart uploads have the number of parts after a dash in their etag
+    assert int(s3_object["ETag"].strip('"').rsplit("-", 1)[1]) > 1
+    body = s3_client.get_object(Bucket=S3_BUCKET, Key=s3_object["Key"])["Body"].read()
+    pd.testing.assert_frame_equal(pd.read_csv(BytesIO(body)), input_df)